@@ -1,12 +1,15 @@
 from flask import session
-from models import Estate, User, Message, Administrator, db
+from models import Estate, EstatePhoto, User, Message, Administrator, ExchangeRate, BASE_CURRENCY, db
+from currency import refresh_currency
+from images import image_pipeline
+from passwords import password_hasher
 from flask_admin.base import expose
 from flask_admin import Admin, AdminIndexView
 from flask_admin.contrib.sqla import ModelView
+from flask_admin.contrib.sqla.form import InlineModelConverter
 from flask_admin.form.upload import FileUploadField
-from wtforms.validators import InputRequired, Email, EqualTo, Length, Regexp
+from wtforms.validators import InputRequired, Email, EqualTo, Length, Regexp, ValidationError
 from wtforms import PasswordField, EmailField
-from werkzeug.security import generate_password_hash
 
 admin = Admin(name="DreamHouse", template_mode="bootstrap4")
 
@@ -100,12 +103,18 @@ class AdministratorAdminView(ModelView):
 
     def on_model_change(self, form, model, is_created):
         if form.password.data:
-            model.password = generate_password_hash(form.password.data)
+            model.password = password_hasher.hash(form.password.data)
         return super(AdministratorAdminView, self).on_model_change(form, model, is_created)
     
     def is_accessible(self):
         return 'admin_logged_in' in session and session['admin_logged_in']
 
+class EstatePhotoInlineConverter(InlineModelConverter):
+    # У Estate две связи с EstatePhoto (photos и cover_photo), в форме редактируется photos.
+    # Пары ключей задаются явно: поиск по связям требует уже настроенных мапперов
+    def _calculate_mapping_key_pair(self, model, info):  # noqa: ARG002
+        return 'photos', 'estate'
+
 class EstateAdminView(ModelView):
     def is_accessible(self):
         return 'admin_logged_in' in session and session['admin_logged_in']
@@ -122,18 +131,27 @@ class EstateAdminView(ModelView):
         'floor': 'Этажность',
         'description': 'Описание',
         'additional_information': 'Дополнительная информация',
-        'photo': 'Фото',
+        'new_photo': 'Добавить фото',
         'user_id': 'ID Пользователя',
         'admin_id': 'ID Админа'
     }
     column_list = ['id', 'type', 'location', 'cost', 'currency', 'bedrooms', 'area', 'floor', 'description', 'additional_information', 'user_id', 'admin_id']
-    form_columns = ['type', 'location', 'cost', 'currency', 'bedrooms', 'area', 'floor', 'description', 'additional_information', 'photo', 'user_id', 'admin_id']
+    form_columns = ['type', 'location', 'cost', 'currency', 'bedrooms', 'area', 'floor', 'description', 'additional_information', 'new_photo', 'user_id', 'admin_id']
     column_sortable_list = ['id', 'type', 'location', 'cost', 'currency', 'bedrooms', 'area', 'floor', 'user_id', 'admin_id']
 
     form_extra_fields = {
-        'photo': FileUploadField('Photos', base_path='static/uploads/')
+        # Не колонка модели: загруженный файл добавляется в estate_photos в on_model_change
+        'new_photo': FileUploadField('Добавить фото', base_path='static/uploads/')
     }
 
+    # Уже загруженные фото: удаление и порядок показа (обложка — наименьшая позиция)
+    inline_model_form_converter = EstatePhotoInlineConverter
+    inline_models = [(EstatePhoto, {
+        'form_columns': ['id', 'filename', 'position'],
+        'column_labels': {'filename': 'Файл', 'position': 'Позиция'},
+        'form_widget_args': {'filename': {'readonly': True}},
+    })]
+
     AVAILABLE_ESTATE_TYPES = [
         (u'Дом', u'Дом'),
         (u'Квартира', u'Квартира'),
@@ -165,7 +183,7 @@ class EstateAdminView(ModelView):
 
     column_searchable_list = ['type', 'location', 'bedrooms']
     column_filters = ['type', 'location', 'cost', 'bedrooms']
-    column_editable_list = ['type', 'location', 'cost', 'currency', 'bedrooms', 'area', 'floor', 'description', 'additional_information', 'photo', 'user_id', 'admin_id']
+    column_editable_list = ['type', 'location', 'cost', 'currency', 'bedrooms', 'area', 'floor', 'description', 'additional_information', 'user_id', 'admin_id']
 
     create_modal = True
     edit_modal = True
@@ -177,6 +195,19 @@ class EstateAdminView(ModelView):
     export_max_rows = 500
     export_types = ['csv']
 
+    def on_model_change(self, form, model, is_created):  # noqa: ARG002
+        filename = getattr(model, 'new_photo', None)
+        if filename:
+            image_pipeline.attach(model, filename)
+        # Фото могли удалить или переставить, а сама строка объявления при этом не меняется
+        model.updated_at = db.func.now()
+
+    def after_model_change(self, form, model, is_created):  # noqa: ARG002
+        # Уменьшенные копии фото создаются в пуле процессов, админка не ждёт ресайза
+        filename = getattr(model, 'new_photo', None)
+        if filename:
+            image_pipeline.submit([filename])
+
 class MessageAdminView(ModelView):
     def is_accessible(self):
         return 'admin_logged_in' in session and session['admin_logged_in']
@@ -214,8 +245,38 @@ class MessageAdminView(ModelView):
     export_max_rows = 500
     export_types = ['csv']
 
+class ExchangeRateAdminView(ModelView):
+    def is_accessible(self):
+        return 'admin_logged_in' in session and session['admin_logged_in']
+
+    column_display_pk = True
+    column_labels = {
+        'currency': 'Валюта',
+        'rate_to_usd': 'Курс к USD',
+        'updated_at': 'Обновлён'
+    }
+    column_list = ['currency', 'rate_to_usd', 'updated_at']
+    form_columns = ['currency', 'rate_to_usd']
+    column_descriptions = {
+        'rate_to_usd': 'Стоимость одной единицы валюты в долларах'
+    }
+
+    can_delete = False
+    can_create = True
+    can_edit = True
+
+    def on_model_change(self, form, model, is_created):  # noqa: ARG002
+        # Курс доллара фиксирован: sync_cost_usd и пересчёт цен считают его равным 1
+        if BASE_CURRENCY in (model.currency, form.currency.object_data):
+            raise ValidationError("Курс доллара всегда равен 1 и не меняется")
+
+    def after_model_change(self, form, model, is_created):  # noqa: ARG002
+        # Цены в долларах пересчитываются для всех объявлений в этой валюте сразу
+        refresh_currency(model.currency)
+
 admin = Admin(name="DreamHouse", template_mode="bootstrap4", index_view=MyAdminIndexView())
 admin.add_view(EstateAdminView(Estate, db.session, name='Недвижимость'))
+admin.add_view(ExchangeRateAdminView(ExchangeRate, db.session, name='Курсы валют'))
 admin.add_view(MessageAdminView(Message, db.session, name='Заявки'))
 admin.add_view(AdministratorAdminView(Administrator, db.session, name='Администраторы'))
 admin.add_view(UserAdminView(User, db.session, name='Пользователи'))
@@ -1,55 +1,105 @@
-import os
-from dotenv import load_dotenv
-from flask import Flask, g, session
-from models import User
-from models import db
-from routes import main_bp
-from admin import admin
+import logging
+
+from flask import Flask
+from flask_babel import Babel
 from flask_migrate import Migrate
-from sqlalchemy import text
+from jinja2 import FileSystemBytecodeCache
 from sqlalchemy.exc import SQLAlchemyError
-from flask_babel import Babel
 
-load_dotenv()
-app = Flask(__name__)
-
-db_host = os.environ.get('DB_HOST')
-db_name = os.environ.get('DB_NAME')
-db_password = os.environ.get('DB_PASSWORD')
-db_username = os.environ.get('DB_USERNAME')
-
-app.config['SQLALCHEMY_DATABASE_URI'] = f"postgresql+psycopg2://{db_username}:{db_password}@{db_host}/{db_name}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config["SECRET_KEY"] = "mysecret"
-app.config['BABEL_DEFAULT_LOCALE'] = 'ru'
-
-db.init_app(app)
-migrate = Migrate(app, db)
-babel = Babel(app)
-app.app_context().push()
-app.register_blueprint(main_bp)
-admin.init_app(app)
-
-try:
-    db.session.execute(text("SELECT 1"))
-    print("Соединение с базой данных успешно установлено.")
-    db.create_all()
-    print("Таблицы успешно созданы.")
-except SQLAlchemyError as e:
-    print("Ошибка при соединении с базой данных:", str(e))
-
-@app.before_request
-def before_request():
-    g.user = None
-    if 'user_id' in session:
-        g.user = User.query.get(session['user_id'])
-
-@app.context_processor
-def inject_user():
-    return dict(current_user=g.user)
+import current_user
+from admin import admin
+from commands import (
+    explain_hot_queries, backfill_estate_numbers, set_exchange_rate_command, maintain_view_history,
+    generate_image_variants, build_static_manifest, init_db_command, warm_up_command
+)
+from config import Config
+from db_pool import engine_options, init_engine, replica_engine_options
+from fragment_cache import FragmentCacheExtension
+from images import image_pipeline
+from logging_setup import logging_setup
+from models import db
+from passwords import password_hasher
+from replica import REPLICA_BIND, replica_router
+from routes import main_bp
+from search_index import search_index
+from static_assets import static_assets
+from view_buffer import view_history_buffer
+from warmup import init_database, warm_up
+
+logger = logging.getLogger(__name__)
+migrate = Migrate()
+babel = Babel()
+
+
+def create_app(config=None):
+    # Создание приложения не обращается к базе данных: соединение проверяется
+    # при первом запросе или явным прогревом (flask warm-up, WARM_UP_ON_START)
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if isinstance(config, dict):
+        app.config.from_mapping(config)
+    elif config is not None:
+        app.config.from_object(config)
+    logging_setup.init_app(app)
+
+    # Опции задаются до первого обращения к app.jinja_env
+    app.jinja_options = dict(
+        app.jinja_options,
+        bytecode_cache=FileSystemBytecodeCache(app.config['TEMPLATE_BYTECODE_CACHE_DIR']),
+        extensions=[FragmentCacheExtension],
+    )
+
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    binds = app.config.get('SQLALCHEMY_BINDS') or {}
+    if isinstance(binds.get(REPLICA_BIND), str):
+        replica_url = binds[REPLICA_BIND]
+        app.config['SQLALCHEMY_BINDS'] = {
+            **binds, REPLICA_BIND: {'url': replica_url, **replica_engine_options(app.config, replica_url)},
+        }
+    db.init_app(app)
+    # Engine создаётся в db.init_app, соединений при этом не открывается
+    with app.app_context():
+        init_engine(db.engine, app.config)
+        if REPLICA_BIND in db.engines:
+            init_engine(db.engines[REPLICA_BIND], app.config)
+    replica_router.init_app(app)
+    current_user.init_app(app)
+    migrate.init_app(app, db)
+    babel.init_app(app)
+    app.register_blueprint(main_bp)
+    admin.init_app(app)
+    search_index.init_app(app)
+    view_history_buffer.init_app(app)
+    image_pipeline.init_app(app)
+    password_hasher.init_app(app)
+    static_assets.init_app(app)
+
+    app.cli.add_command(explain_hot_queries)
+    app.cli.add_command(backfill_estate_numbers)
+    app.cli.add_command(set_exchange_rate_command)
+    app.cli.add_command(maintain_view_history)
+    app.cli.add_command(generate_image_variants)
+    app.cli.add_command(build_static_manifest)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(warm_up_command)
+
+    if app.config.get('WARM_UP_ON_START'):
+        try:
+            warm_up(app)
+        except SQLAlchemyError as e:
+            # Процесс всё равно запускается, соединение будет установлено при первом запросе
+            logger.warning("Прогрев не выполнен, база данных недоступна: %s", e)
+
+    return app
 
 
 if __name__ == "__main__":
 
     # Запуск приложения Flask
+    app = create_app()
+    try:
+        with app.app_context():
+            init_database()
+    except SQLAlchemyError as e:
+        print("Ошибка при соединении с базой данных:", str(e))
     app.run(host="0.0.0.0", debug=True)
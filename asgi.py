@@ -0,0 +1,177 @@
+# Асинхронный путь чтения: JSON-эндпоинты каталога, поиска, фасетов и карточки объявления
+# под /async/api ждут Postgres без блокировки воркера. Остальные адреса обслуживает
+# Flask-приложение, подключённое через WSGI-адаптер.
+# Запуск: uvicorn --factory asgi:create_asgi_app --workers 4
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MultiDict
+
+from app import create_app
+from db_pool import async_engine_options, init_engine
+from estate_search import (
+    SORT_ORDERS,
+    cover_photo_filename,
+    facet_query,
+    facets_from_rows,
+    range_filters_from_args,
+    search_conditions,
+    search_order,
+)
+from models import Estate
+from routes import (
+    ESTATE_API_FIELDS,
+    estate_api_request,
+    facets_cache,
+    facets_request,
+    search_cache,
+    search_page_key,
+)
+
+SEARCH_PER_PAGE = 10
+SEARCH_API_FIELDS = ('id', 'type', 'location', 'cost', 'currency', 'cost_usd', 'bedrooms', 'cover_photo')
+
+
+def async_database_url(config):
+    # По умолчанию та же база, что у Flask-приложения, через драйвер asyncpg
+    if config.get('ASYNC_DATABASE_URI'):
+        return config['ASYNC_DATABASE_URI']
+    return make_url(config['SQLALCHEMY_DATABASE_URI']).set(drivername='postgresql+asyncpg')
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Engine создаётся в цикле событий воркера и закрывается вместе с ним
+    config = app.state.flask_app.config
+    url = make_url(async_database_url(config))
+    options = async_engine_options(config) if url.get_backend_name() == 'postgresql' else {}
+    engine = create_async_engine(url, **options)
+    init_engine(engine.sync_engine, config)
+    app.state.engine = engine
+    app.state.sessions = async_sessionmaker(engine, expire_on_commit=False)
+    yield
+    await engine.dispose()
+
+
+def json_response(request, data, status_code=200):
+    # Сериализация как во Flask: Decimal и даты выглядят одинаково в обоих путях
+    body = request.app.state.flask_app.json.dumps(data)
+    return Response(body, status_code=status_code, media_type='application/json')
+
+
+def query_args(request):
+    # Общие функции разбора параметров рассчитаны на MultiDict из werkzeug
+    return MultiDict(list(request.query_params.multi_items()))
+
+
+def bad_request(request, message):
+    return json_response(request, {'error': message}, status_code=400)
+
+
+async def list_estate(request):
+    try:
+        writer, query = estate_api_request(query_args(request), request.app.state.flask_app.json.dumps)
+    except ValueError as e:
+        return bad_request(request, str(e))
+
+    async def generate():
+        yield writer.start()
+        async with request.app.state.engine.connect() as connection:
+            async for row in await connection.stream(query):
+                yield writer.row(row)
+        yield writer.end()
+
+    return StreamingResponse(generate(), media_type=writer.mimetype)
+
+
+async def show_estate(request):
+    async with request.app.state.sessions() as session:
+        estate = await session.scalar(
+            select(Estate).options(selectinload(Estate.photos)).where(Estate.id == request.path_params['id'])
+        )
+    if estate is None:
+        return json_response(request, {'error': "Объявление не найдено"}, status_code=404)
+    data = {field: getattr(estate, field) for field in ESTATE_API_FIELDS if field != 'cover_photo'}
+    data['updated_at'] = estate.updated_at
+    data['photos'] = [
+        {'filename': photo.filename, 'width': photo.width, 'height': photo.height}
+        for photo in estate.photos
+    ]
+    return json_response(request, data)
+
+
+async def search(request):
+    args = query_args(request)
+    try:
+        ranges = range_filters_from_args(args)
+        key = search_page_key(
+            args.get('price_range'), args.get('bedrooms'), args.get('type'),
+            max(args.get('page', 1, type=int), 1), SEARCH_PER_PAGE, ranges,
+            args.get('sort') if args.get('sort') in SORT_ORDERS else None,
+            (args.get('q') or '').strip() or None,
+        )
+        estate_type, bedrooms, price_range, _, sort, q, page, per_page = key
+        conditions = search_conditions(price_range, bedrooms, estate_type, ranges, q)
+    except ValueError:
+        return bad_request(request, "Некорректный диапазон цен")
+    if sort:
+        conditions.append(Estate.cost_usd.isnot(None))
+
+    async with request.app.state.engine.connect() as connection:
+        async def compute():
+            # Тот же кэш и та же выдача, что у /search; индекс в памяти здесь не используется
+            total = await connection.scalar(select(func.count()).select_from(Estate).where(*conditions))
+            ids = (await connection.scalars(
+                select(Estate.id).where(*conditions).order_by(*search_order(sort, q))
+                .offset((page - 1) * per_page).limit(per_page)
+            )).all()
+            return list(ids), total
+
+        ids, total = await search_cache.get_or_compute_async(key, compute)
+        columns = [cover_photo_filename().label(field) if field == 'cover_photo' else getattr(Estate, field)
+                   for field in SEARCH_API_FIELDS]
+        rows = (await connection.execute(select(*columns).where(Estate.id.in_(ids)))).all() if ids else []
+
+    by_id = {row.id: row._asdict() for row in rows}
+    return json_response(request, {
+        'estate': [by_id[estate_id] for estate_id in ids if estate_id in by_id],
+        'total': total,
+        'page': page,
+        'total_pages': (total + per_page - 1) // per_page,
+    })
+
+
+async def search_facets(request):
+    try:
+        key, filters, ranges, q = facets_request(query_args(request))
+    except ValueError:
+        return bad_request(request, "Некорректный диапазон цен")
+
+    async def compute():
+        async with request.app.state.engine.connect() as connection:
+            return facets_from_rows(await connection.execute(facet_query(*filters, ranges, q)))
+
+    return json_response(request, await facets_cache.get_or_compute_async(key, compute))
+
+
+def create_asgi_app(flask_app=None):
+    flask_app = flask_app or create_app()
+    app = Starlette(
+        routes=[
+            Route('/async/api/estate', list_estate),
+            Route('/async/api/estate/{id:int}', show_estate),
+            Route('/async/api/search', search),
+            Route('/async/api/search/facets', search_facets),
+            Mount('/', app=WSGIMiddleware(flask_app)),
+        ],
+        lifespan=lifespan,
+    )
+    app.state.flask_app = flask_app
+    return app
@@ -0,0 +1,95 @@
+# Запросы в секунду на один воркер: синхронные маршруты Flask под gunicorn
+# и асинхронные /async/api под uvicorn. Каждый сервер запускается отдельным процессом,
+# нагрузка — одновременные запросы из потоков, параметры меняются, чтобы не попадать в кэши.
+# Запуск из корня проекта: python benchmarks/bench_async.py [--requests 2000] [--concurrency 32]
+import argparse
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pagination import encode_cursor  # noqa: E402
+
+HOST = '127.0.0.1'
+
+SERVERS = {
+    'sync': [sys.executable, '-m', 'gunicorn', '--workers', '1', '--bind', f'{HOST}:{{port}}', 'app:create_app()'],
+    'async': [sys.executable, '-m', 'uvicorn', '--factory', 'asgi:create_asgi_app', '--workers', '1',
+              '--host', HOST, '--port', '{port}', '--log-level', 'warning'],
+}
+
+# Пары адресов: синхронный маршрут и его асинхронный вариант
+ENDPOINTS = {
+    'catalog': ('/api/estate?fields=id,type,cost,cover_photo&limit=20&after={cursor}',
+                '/async/api/estate?fields=id,type,cost,cover_photo&limit=20&after={cursor}'),
+    'facets': ('/api/search/facets?area_min={area}', '/async/api/search/facets?area_min={area}'),
+}
+
+
+def make_urls(template, port, total):
+    base = f'http://{HOST}:{port}'
+    return [
+        base + template.format(cursor=encode_cursor(random.randint(0, 1000)), area=random.randint(20, 200))
+        for _ in range(total)
+    ]
+
+
+def wait_until_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://{HOST}:{port}/about-us', timeout=1).read()
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError(f"Сервер на порту {port} не запустился за {timeout} с")
+
+
+def fetch(url):
+    started = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=60) as response:
+        response.read()
+    return time.perf_counter() - started
+
+
+def load(urls, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = sorted(pool.map(fetch, urls))
+    elapsed = time.perf_counter() - started
+    return len(urls) / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    for index, (server, command) in enumerate(SERVERS.items()):
+        port = args.port + index
+        process = subprocess.Popen([part.format(port=port) for part in command], cwd=ROOT)
+        try:
+            wait_until_ready(port)
+            for name, templates in ENDPOINTS.items():
+                urls = make_urls(templates[index], port, args.requests)
+                # Прогрев соединений пула и кэшей шаблонов
+                load(urls[:args.concurrency], args.concurrency)
+                rps, p50, p95 = load(urls, args.concurrency)
+                print(f"{server:5} {name:8}: {rps:8.1f} запросов/с на воркер, "
+                      f"p50 {p50 * 1000:.1f} мс, p95 {p95 * 1000:.1f} мс")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# Полнотекстовый поиск против ILIKE на большом каталоге.
+# Нужен локальный Postgres из .env. Тестовые объявления добавляются с location = 'bench'
+# и удаляются ключом --cleanup.
+# Запуск из корня проекта: python benchmarks/bench_fulltext.py --seed 1000000
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import db  # noqa: E402
+
+WORDS = [
+    'Минск', 'Гродно', 'Брест', 'Гомель', 'центр', 'ремонт', 'балкон', 'парковка', 'лифт', 'школа',
+    'парк', 'метро', 'кирпичный', 'панельный', 'новостройка', 'евроремонт', 'мебель', 'гараж',
+    'участок', 'баня', 'камин', 'терраса', 'вид', 'река', 'лес', 'тихий', 'двор', 'охрана',
+]
+
+QUERIES = ['ремонт', 'балкон парковка', 'евроремонт -мебель', '"тихий двор"', 'Гродно баня']
+
+SEED_SQL = """
+    INSERT INTO estate (type, location, cost, currency, bedrooms, description)
+    SELECT
+        CASE WHEN n % 3 = 0 THEN 'Дом' ELSE 'Квартира' END,
+        'bench ' || (:words)[1 + n % array_length(:words, 1)],
+        (random() * 300000)::int,
+        'USD',
+        (1 + n % 5)::text,
+        (SELECT string_agg((:words)[1 + (random() * (array_length(:words, 1) - 1))::int], ' ')
+         FROM generate_series(1, 30 + n % 20))
+    FROM generate_series(1, :count) AS n
+"""
+
+
+def measure(name, sql, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        db.session.execute(text(sql), params).all()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(f"{name:45} медиана {timings[len(timings) // 2] * 1000:8.2f} мс, максимум {timings[-1] * 1000:8.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=0, help='Сколько тестовых объявлений добавить')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--cleanup', action='store_true', help='Удалить тестовые объявления')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.seed:
+            started = time.perf_counter()
+            db.session.execute(text(SEED_SQL), {'words': WORDS, 'count': args.seed})
+            db.session.commit()
+            db.session.execute(text("ANALYZE estate"))
+            db.session.commit()
+            print(f"Добавлено {args.seed} объявлений за {time.perf_counter() - started:.1f} с")
+
+        total = db.session.execute(text("SELECT count(*) FROM estate")).scalar()
+        print(f"Объявлений в таблице: {total}")
+
+        for q in QUERIES:
+            measure(
+                f"tsvector: {q}",
+                """
+                SELECT id FROM estate
+                WHERE search_vector @@ websearch_to_tsquery('russian', :q)
+                ORDER BY ts_rank_cd(search_vector, websearch_to_tsquery('russian', :q)) DESC, id
+                LIMIT 10
+                """,
+                {'q': q},
+                args.repeat,
+            )
+            first_word = q.strip('"').split()[0]
+            measure(
+                f"ILIKE: {first_word}",
+                "SELECT id FROM estate WHERE location ILIKE :pattern OR description ILIKE :pattern LIMIT 10",
+                {'pattern': f'%{first_word}%'},
+                args.repeat,
+            )
+
+        if args.cleanup:
+            db.session.execute(text("DELETE FROM estate WHERE location LIKE 'bench %'"))
+            db.session.commit()
+            print("Тестовые объявления удалены")
+
+
+if __name__ == '__main__':
+    main()
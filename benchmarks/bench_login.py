@@ -0,0 +1,67 @@
+# Пропускная способность входа: успешные логины в секунду всего и на ядро для разных методов хэширования.
+# Проверки паролей идут через ограниченный пул (PASSWORD_HASH_WORKERS), запросы — из нескольких потоков.
+# Запуск из корня проекта: python benchmarks/bench_login.py [--logins 200] [--threads 16] [--workers 2]
+#     [--methods scrypt,pbkdf2:sha256:600000]
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import User, db  # noqa: E402
+from passwords import password_hasher  # noqa: E402
+
+PASSWORD = 'bench-password'
+
+
+def run(method, workers, logins, threads):
+    app = create_app({'PASSWORD_HASH_METHOD': method, 'PASSWORD_HASH_WORKERS': workers,
+                      'PASSWORD_HASH_MAX_PENDING': threads, 'PASSWORD_HASH_WAIT_SECONDS': 60})
+    email = f'bench-login-{int(time.time() * 1000)}@example.com'
+    with app.app_context():
+        user = User(name='Bench', email=email, password=generate_password_hash(PASSWORD, method=method))
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    def login(_):
+        response = app.test_client().post('/login', data={'email': email, 'password': PASSWORD})
+        return response.status_code == 302 and response.location == '/'
+
+    rejected = password_hasher.rejected
+    try:
+        login(None)  # Прогрев: пул потоков, соединения с базой
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            succeeded = sum(pool.map(login, range(logins)))
+        elapsed = time.perf_counter() - started
+    finally:
+        with app.app_context():
+            db.session.execute(db.delete(User).where(User.id == user_id))
+            db.session.commit()
+        password_hasher.shutdown()
+
+    cores = min(workers, os.cpu_count() or 1)
+    print(f"{method}: {succeeded}/{logins} входов за {elapsed:.2f} с — {logins / elapsed:.1f} в секунду, "
+          f"{logins / elapsed / cores:.1f} на ядро ({cores} потоков KDF), отказов {password_hasher.rejected - rejected}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--methods', default='scrypt,pbkdf2:sha256:600000')
+    args = parser.parse_args()
+
+    for method in args.methods.split(','):
+        run(method.strip(), args.workers, args.logins, args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# Сравнение поиска через индекс в памяти и через SQL.
+# Запуск из корня проекта: python benchmarks/bench_search.py [количество запросов]
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from models import Estate  # noqa: E402
+from routes import perform_search  # noqa: E402
+from search_index import search_index  # noqa: E402
+
+TYPES = [None, 'Дом', 'Квартира']
+BEDROOMS = [None, 'Студия', '1', '2', '3', '4', '5']
+PRICE_RANGES = [None, '0-10000', '10000-30000', '30000-50000', '50000-100000', '100000-200000', '200000-more']
+PER_PAGE = 10
+
+
+def run_sql(filters, page):
+    price_range, bedrooms, estate_type = filters
+    query = perform_search(price_range, bedrooms, estate_type).order_by(Estate.id)
+    return query.count(), query.paginate(page=page, per_page=PER_PAGE, error_out=False).items
+
+
+def run_index(filters, page):
+    price_range, bedrooms, estate_type = filters
+    return search_index.search(price_range, bedrooms, estate_type, (page - 1) * PER_PAGE, PER_PAGE)
+
+
+def measure(name, func, requests):
+    started = time.perf_counter()
+    for filters, page in requests:
+        func(filters, page)
+    elapsed = time.perf_counter() - started
+    print(f"{name}: {len(requests)} запросов за {elapsed:.3f} с, {elapsed / len(requests) * 1000:.3f} мс на запрос")
+
+
+def main():
+    app = create_app()
+    app.app_context().push()
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    combinations = list(itertools.product(PRICE_RANGES, BEDROOMS, TYPES))
+    requests = [(combinations[i % len(combinations)], 1 + i % 5) for i in range(total)]
+
+    started = time.perf_counter()
+    search_index.rebuild()
+    print(f"Построение индекса: {time.perf_counter() - started:.3f} с")
+
+    measure("SQL", run_sql, requests)
+    measure("Индекс", run_index, requests)
+
+
+if __name__ == '__main__':
+    main()
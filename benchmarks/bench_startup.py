@@ -0,0 +1,65 @@
+# Время запуска: импорт app, create_app() и первые запросы, каждый замер в новом процессе.
+# Первый прогон компилирует шаблоны, следующие берут байткод из TEMPLATE_BYTECODE_CACHE_DIR.
+# Запуск из корня проекта: python benchmarks/bench_startup.py [--runs 3] [--path /]
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child(path):
+    sys.path.insert(0, ROOT)
+    timings = {}
+
+    started = time.perf_counter()
+    import app  # noqa: F401
+    timings['import'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    application = app.create_app()
+    timings['create_app'] = time.perf_counter() - started
+
+    client = application.test_client()
+    for name in ('first_request', 'second_request'):
+        started = time.perf_counter()
+        response = client.get(path)
+        timings[name] = time.perf_counter() - started
+        timings[f'{name}_status'] = response.status_code
+    print(json.dumps(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--path', default='/about-us')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.path)
+        return
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, TEMPLATE_BYTECODE_CACHE_DIR=cache_dir)
+        for run in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, __file__, '--child', '--path', args.path],
+                env=env, cwd=ROOT, capture_output=True, text=True, check=True,
+            ).stdout
+            timings = json.loads(output.strip().splitlines()[-1])
+            label = 'без байткода' if run == 0 else 'с байткодом'
+            print(
+                f"Запуск {run + 1} ({label}): импорт {timings['import'] * 1000:.0f} мс, "
+                f"create_app {timings['create_app'] * 1000:.0f} мс, "
+                f"первый запрос {timings['first_request'] * 1000:.0f} мс ({timings['first_request_status']}), "
+                f"второй {timings['second_request'] * 1000:.0f} мс"
+            )
+
+
+if __name__ == '__main__':
+    main()
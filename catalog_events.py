@@ -0,0 +1,47 @@
+from sqlalchemy import event, func, update
+from sqlalchemy.orm import Session, object_session
+
+from models import CatalogVersion, Estate, EstatePhoto, ExchangeRate
+
+_listeners = []
+_catalog_version = CatalogVersion.__table__
+
+
+def on_catalog_change(func):
+    # Регистрирует функцию, вызываемую после коммита, изменившего объявления
+    _listeners.append(func)
+    return func
+
+
+def mark_catalog_changed(session, connection=None):
+    # Для массовых UPDATE, которые не вызывают события модели Estate.
+    # Версия каталога увеличивается один раз за транзакцию и откатывается вместе с ней
+    if session.info.get('catalog_changed'):
+        return
+    session.info['catalog_changed'] = True
+    (connection or session.connection()).execute(
+        update(_catalog_version).values(version=_catalog_version.c.version + 1, updated_at=func.now())
+    )
+
+
+def _mark_catalog_changed(_mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        mark_catalog_changed(session, connection)
+
+
+for _model in (Estate, EstatePhoto, ExchangeRate):
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event_name, _mark_catalog_changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_catalog_changed(session):
+    if session.info.pop('catalog_changed', False):
+        for func in _listeners:
+            func()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_catalog_changed(session):
+    session.info.pop('catalog_changed', None)
@@ -0,0 +1,153 @@
+import json
+import os
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import text
+
+from currency import set_exchange_rate
+from estate_parsing import backfill_numeric_columns
+from history_maintenance import (
+    drop_old_partitions,
+    ensure_partitions,
+    purge_default_partition,
+)
+from images import image_info, image_pipeline
+from models import EstatePhoto, db
+from static_assets import build_manifest
+from warmup import init_database, warm_up
+
+# Горячие запросы приложения: (название, SQL). Параметры :user_id и :estate_id
+# подставляются из существующих данных
+HOT_QUERIES = [
+    ("Главная страница", "SELECT * FROM estate ORDER BY id LIMIT 10"),
+    ("Главная страница: количество", "SELECT count(id) FROM estate"),
+    ("Поиск: тип и комнаты",
+     "SELECT id FROM estate WHERE type = 'Квартира' AND bedrooms = '2' ORDER BY id LIMIT 10"),
+    ("Поиск: тип, комнаты и цена",
+     "SELECT id FROM estate WHERE type = 'Дом' AND bedrooms = '3' AND cost_usd BETWEEN 50000 AND 100000 ORDER BY id LIMIT 10"),
+    ("Поиск: комнаты", "SELECT count(*) FROM estate WHERE bedrooms = '2'"),
+    ("Поиск: цена", "SELECT count(*) FROM estate WHERE cost_usd BETWEEN 30000 AND 50000"),
+    ("Страница объявления: в избранном?",
+     "SELECT * FROM favorites WHERE user_id = :user_id AND estate_id = :estate_id LIMIT 1"),
+    ("Избранное", "SELECT * FROM favorites WHERE user_id = :user_id LIMIT 10"),
+    ("История просмотров",
+     "SELECT * FROM view_history WHERE user_id = :user_id ORDER BY timestamp DESC LIMIT 10"),
+    ("Очистка истории", "DELETE FROM view_history WHERE user_id = :user_id"),
+]
+
+
+@click.command('explain-hot-queries')
+@with_appcontext
+def explain_hot_queries():
+    """Выполняет EXPLAIN ANALYZE для горячих запросов (запустите до и после миграции и сравните)."""
+    params = {
+        'user_id': db.session.execute(text("SELECT coalesce(min(id), 0) FROM users")).scalar(),
+        'estate_id': db.session.execute(text("SELECT coalesce(min(id), 0) FROM estate")).scalar(),
+    }
+    for name, sql in HOT_QUERIES:
+        click.echo(f"=== {name}")
+        click.echo(sql)
+        # EXPLAIN ANALYZE действительно выполняет запрос, поэтому изменения откатываются
+        plan = db.session.execute(text("EXPLAIN (ANALYZE, BUFFERS) " + sql), params).scalars().all()
+        db.session.rollback()
+        click.echo("\n".join(plan))
+        click.echo()
+
+
+@click.command('backfill-estate-numbers')
+@click.option('--batch-size', default=1000, show_default=True, help='Количество объявлений в одной транзакции.')
+@with_appcontext
+def backfill_estate_numbers(batch_size):
+    """Заполняет числовые колонки комнат, площади и этажа из текстовых значений."""
+    with db.engine.connect() as connection:
+        backfill_numeric_columns(connection, batch_size=batch_size, commit=connection.commit, echo=click.echo)
+
+
+@click.command('set-exchange-rate')
+@click.argument('currency')
+@click.argument('rate_to_usd', type=float)
+@with_appcontext
+def set_exchange_rate_command(currency, rate_to_usd):
+    """Сохраняет курс валюты к доллару и пересчитывает цены объявлений."""
+    try:
+        updated = set_exchange_rate(currency.upper(), rate_to_usd)
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint='CURRENCY') from None
+    click.echo(f"Курс {currency.upper()} = {rate_to_usd} USD, пересчитано объявлений: {updated}")
+
+
+@click.command('maintain-view-history')
+@click.option('--months-ahead', default=3, show_default=True, help='На сколько месяцев вперёд создать секции.')
+@click.option('--retention-months', type=int, default=None,
+              help='Срок хранения истории в месяцах (по умолчанию VIEW_HISTORY_RETENTION_MONTHS).')
+@with_appcontext
+def maintain_view_history(months_ahead, retention_months):
+    """Создаёт будущие секции view_history и удаляет секции старше срока хранения."""
+    if retention_months is None:
+        retention_months = current_app.config['VIEW_HISTORY_RETENTION_MONTHS']
+    with db.engine.begin() as connection:
+        for name in ensure_partitions(connection, months_ahead=months_ahead):
+            click.echo(f"Создана секция {name}")
+        for name in drop_old_partitions(connection, retention_months):
+            click.echo(f"Удалена секция {name}")
+        purged = purge_default_partition(connection, retention_months)
+        if purged:
+            click.echo(f"Из секции по умолчанию удалено строк: {purged}")
+
+
+@click.command('generate-image-variants')
+@click.option('--force', is_flag=True, help='Пересоздать уже существующие варианты.')
+@with_appcontext
+def generate_image_variants(force):
+    """Создаёт уменьшенные копии (и WebP) для фотографий в static/uploads и заполняет их размеры."""
+    upload_dir = image_pipeline.upload_dir
+    filenames = sorted(
+        name for name in os.listdir(upload_dir)
+        if os.path.isfile(os.path.join(upload_dir, name))
+        and os.path.splitext(name)[1].lower() in ('.jpg', '.jpeg', '.png', '.webp')
+    )
+    failed = 0
+    for filename, future in zip(filenames, image_pipeline.submit(filenames, force=force), strict=True):
+        try:
+            future.result()
+        except Exception as e:
+            failed += 1
+            click.echo(f"{filename}: {e}")
+    click.echo(f"Обработано фотографий: {len(filenames) - failed}, ошибок: {failed}")
+
+    # Фото, перенесённые миграцией из estate.photo, пока без размеров
+    updated = 0
+    for photo in EstatePhoto.query.filter(EstatePhoto.byte_size.is_(None)):
+        photo.width, photo.height, photo.byte_size = image_info(os.path.join(upload_dir, photo.filename))
+        updated += photo.byte_size is not None
+    db.session.commit()
+    click.echo(f"Заполнены размеры фотографий: {updated}")
+
+
+@click.command('build-static-manifest')
+@with_appcontext
+def build_static_manifest():
+    """Собирает манифест хэшей статических файлов (запускается при деплое)."""
+    manifest = build_manifest(current_app.static_folder)
+    manifest_path = current_app.config.get('STATIC_MANIFEST_PATH') or os.path.join(current_app.root_path, 'static-manifest.json')
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    click.echo(f"Записан манифест {manifest_path}: файлов {len(manifest)}")
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Создаёт таблицы и секции view_history (для разработки; в рабочей базе — flask db upgrade)."""
+    init_database()
+    click.echo("Таблицы созданы")
+
+
+@click.command('warm-up')
+@with_appcontext
+def warm_up_command():
+    """Прогревает процесс: проверяет БД, строит индекс поиска и компилирует шаблоны."""
+    for name, seconds in warm_up(current_app._get_current_object()).items():
+        click.echo(f"{name}: {seconds:.3f} с")
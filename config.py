@@ -0,0 +1,69 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class Config:
+    SQLALCHEMY_DATABASE_URI = f"postgresql+psycopg2://{os.environ.get('DB_USERNAME')}:{os.environ.get('DB_PASSWORD')}@{os.environ.get('DB_HOST')}/{os.environ.get('DB_NAME')}"
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Пул соединений: размер, запас сверх размера, ожидание свободного соединения и пересоздание старых (секунды)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    # Проверка соединения перед выдачей из пула, чтобы переживать перезапуск и переключение базы
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+    # Ограничение времени одного запроса в миллисекундах, 0 — без ограничения
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+    # Работа через пулер в режиме транзакций (PgBouncer pool_mode=transaction)
+    DB_TRANSACTION_POOLER = os.environ.get('DB_TRANSACTION_POOLER', '0') == '1'
+    # Реплика только для чтения (DB_REPLICA_HOST, при проверке на одном сервере — отдельная база DB_REPLICA_NAME)
+    SQLALCHEMY_BINDS = {
+        'replica': f"postgresql+psycopg2://{os.environ.get('DB_USERNAME')}:{os.environ.get('DB_PASSWORD')}@{os.environ.get('DB_REPLICA_HOST')}/{os.environ.get('DB_REPLICA_NAME', os.environ.get('DB_NAME'))}"
+    } if os.environ.get('DB_REPLICA_HOST') else {}
+    # При большем отставании реплики (секунды) чтения идут в основную базу; отставание проверяется раз в N секунд
+    DB_REPLICA_MAX_LAG_SECONDS = float(os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', 5))
+    DB_REPLICA_LAG_CHECK_SECONDS = int(os.environ.get('DB_REPLICA_LAG_CHECK_SECONDS', 5))
+    # Подключение к реплике (секунды) и проверка отставания (мс) дольше этого считаются недоступностью реплики
+    DB_REPLICA_CONNECT_TIMEOUT = int(os.environ.get('DB_REPLICA_CONNECT_TIMEOUT', 2))
+    DB_REPLICA_LAG_CHECK_TIMEOUT_MS = int(os.environ.get('DB_REPLICA_LAG_CHECK_TIMEOUT_MS', 500))
+    # После записи пользователь столько секунд читает из основной базы и видит свои изменения
+    DB_READ_YOUR_WRITES_SECONDS = int(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', 10))
+    # Асинхронный путь чтения (asgi.py); по умолчанию основная база через asyncpg
+    ASYNC_DATABASE_URI = os.environ.get('ASYNC_DATABASE_URI')
+    # Логи пишет фоновый поток: уровень, формат (json или text), файл (по умолчанию stderr), размер очереди
+    # и доля записей ниже WARNING по логгерам, например 'routes=0.1,sqlalchemy.engine=0.01'
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+    LOG_FILE = os.environ.get('LOG_FILE')
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    LOG_SAMPLING = os.environ.get('LOG_SAMPLING', '')
+    # Пароли: метод werkzeug (scrypt, scrypt:16384:8:1, pbkdf2:sha256:600000); устаревшие хэши
+    # пересчитываются при входе. KDF выполняют N потоков, в очереди не больше M проверок
+    # (при полной очереди попытка входа сразу получает 503), и дольше T секунд проверка не ждёт (тоже 503)
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 16))
+    PASSWORD_HASH_WAIT_SECONDS = float(os.environ.get('PASSWORD_HASH_WAIT_SECONDS', 5))
+    SECRET_KEY = "mysecret"
+    BABEL_DEFAULT_LOCALE = 'ru'
+    # Поиск по индексу в памяти процесса вместо запросов к Postgres
+    SEARCH_INDEX_ENABLED = os.environ.get('SEARCH_INDEX_ENABLED', '0') == '1'
+    SEARCH_INDEX_REFRESH_SECONDS = int(os.environ.get('SEARCH_INDEX_REFRESH_SECONDS', 300))
+    # История просмотров пишется пачками: по N событий или раз в T миллисекунд
+    VIEW_HISTORY_BUFFER_SIZE = int(os.environ.get('VIEW_HISTORY_BUFFER_SIZE', 100))
+    VIEW_HISTORY_FLUSH_INTERVAL_MS = int(os.environ.get('VIEW_HISTORY_FLUSH_INTERVAL_MS', 1000))
+    # Повторные просмотры одного объявления в пределах окна схлопываются в последний из них
+    VIEW_HISTORY_DEDUP_SECONDS = int(os.environ.get('VIEW_HISTORY_DEDUP_SECONDS', 1800))
+    VIEW_HISTORY_RETENTION_MONTHS = int(os.environ.get('VIEW_HISTORY_RETENTION_MONTHS', 12))
+    # Уменьшенные копии фотографий: WebP рядом с JPEG и число процессов для ресайза
+    IMAGE_VARIANTS_WEBP = os.environ.get('IMAGE_VARIANTS_WEBP', '1') == '1'
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+    # Превышение бюджета запросов маршрута: предупреждение в логе или исключение
+    QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', '0') == '1'
+    # Каталог для скомпилированных шаблонов (по умолчанию во временной папке)
+    TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR')
+    # Прогрев (проверка БД, индекс поиска, шаблоны) при создании приложения, а не при первом запросе
+    WARM_UP_ON_START = os.environ.get('WARM_UP_ON_START', '0') == '1'
@@ -0,0 +1,45 @@
+from sqlalchemy import func, update
+
+from catalog_events import mark_catalog_changed
+from models import BASE_CURRENCY, Estate, ExchangeRate, db
+from search_index import search_index
+
+
+def recompute_cost_usd(connection, currency):
+    # Пересчёт цен всех объявлений в валюте одним UPDATE ... FROM exchange_rates.
+    # Валюта не указана — это доллары, как и в sync_cost_usd
+    estate = Estate.__table__
+    rates = ExchangeRate.__table__
+    estate_currency = func.coalesce(estate.c.currency, BASE_CURRENCY)
+    if currency == BASE_CURRENCY:
+        # Курс доллара берётся из кода, как в sync_cost_usd, а не из строки exchange_rates
+        result = connection.execute(update(estate).where(estate_currency == currency).values(cost_usd=estate.c.cost))
+        return result.rowcount
+    result = connection.execute(
+        update(estate)
+        .where(estate_currency == currency, rates.c.currency == estate_currency)
+        .values(cost_usd=estate.c.cost * rates.c.rate_to_usd)
+    )
+    return result.rowcount
+
+
+def refresh_currency(currency):
+    # Вызывается после изменения курса: пересчитывает цены и сбрасывает кэши каталога
+    updated = recompute_cost_usd(db.session.connection(), currency)
+    mark_catalog_changed(db.session)
+    db.session.commit()
+    if search_index.enabled:
+        search_index.rebuild_in_background()
+    return updated
+
+
+def set_exchange_rate(currency, rate_to_usd):
+    if currency == BASE_CURRENCY:
+        raise ValueError("Курс доллара всегда равен 1 и не меняется")
+    rate = db.session.get(ExchangeRate, currency)
+    if rate is None:
+        rate = ExchangeRate(currency=currency)
+        db.session.add(rate)
+    rate.rate_to_usd = rate_to_usd
+    db.session.flush()
+    return refresh_currency(currency)
@@ -0,0 +1,55 @@
+from collections import namedtuple
+
+from flask import Flask, g, session
+from werkzeug.local import LocalProxy
+
+from cache import TTLCache
+from models import User, db
+
+USER_CACHE_TTL = 60
+USER_CACHE_SIZE = 10000
+
+# Снимок пользователя без привязки к сессии SQLAlchemy, его безопасно хранить между запросами
+CurrentUser = namedtuple('CurrentUser', ['id', 'name', 'email'])
+
+user_cache = TTLCache(ttl=USER_CACHE_TTL, maxsize=USER_CACHE_SIZE)
+
+
+def load_user(user_id):
+    def compute():
+        row = db.session.execute(
+            db.select(User.id, User.name, User.email).where(User.id == user_id)
+        ).first()
+        return CurrentUser(*row) if row else None
+
+    return user_cache.get_or_compute(user_id, compute)
+
+
+def invalidate_user(user_id):
+    user_cache.delete(user_id)
+
+
+class LazyUserGlobals(Flask.app_ctx_globals_class):
+    # g.user загружается при первом обращении, а не в before_request
+    def __getattr__(self, name):
+        if name != 'user':
+            return super().__getattr__(name)
+        user_id = session.get('user_id')
+        self.user = load_user(user_id) if user_id else None
+        return self.user
+
+
+current_user = LocalProxy(lambda: g.user)
+
+
+def init_app(app):
+    app.app_ctx_globals_class = LazyUserGlobals
+
+    @app.before_request
+    def reset_user():
+        # Контекст приложения может пережить запрос, поэтому пользователь предыдущего запроса сбрасывается
+        g.pop('user', None)
+
+    @app.context_processor
+    def inject_user():
+        return {'current_user': current_user}
@@ -0,0 +1,169 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats:
+    # Счётчики пула соединений процесса: ожидание свободного соединения, новые и сброшенные соединения
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_wait(self, seconds, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'timeouts': self.timeouts,
+                'avg_wait_ms': round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else None,
+                'max_wait_ms': round(self.max_wait * 1000, 3),
+            }
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool, который замеряет время ожидания соединения (в том числе при исчерпании пула)
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            pool_stats.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_stats.record_wait(time.perf_counter() - started)
+        return connection
+
+
+def engine_options(config, url=None):
+    # Параметры create_engine из настроек DB_POOL_* для Postgres; для других баз — настройки по умолчанию
+    url = make_url(url or config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() != 'postgresql':
+        return {}
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    connect_args = {}
+    statement_timeout = config['DB_STATEMENT_TIMEOUT_MS']
+    if config['DB_TRANSACTION_POOLER']:
+        # Пулер в режиме транзакций не передаёт параметры запуска и не сохраняет состояние сессии:
+        # таймаут задаётся SET LOCAL в каждой транзакции, подготовленные запросы отключены
+        if url.get_driver_name() == 'psycopg':
+            connect_args['prepare_threshold'] = None
+    elif statement_timeout:
+        connect_args['options'] = f"-c statement_timeout={int(statement_timeout)}"
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+def replica_engine_options(config, url):
+    # Flask-SQLAlchemy не применяет SQLALCHEMY_ENGINE_OPTIONS к SQLALCHEMY_BINDS, поэтому реплике
+    # нужны свои параметры. Ограничение на подключение не даёт недоступной реплике задерживать
+    # запросы, которые ждут проверки её отставания
+    options = engine_options(config, url)
+    if options:
+        options.setdefault('connect_args', {})['connect_timeout'] = config['DB_REPLICA_CONNECT_TIMEOUT']
+    return options
+
+
+def async_engine_options(config):
+    # То же для create_async_engine с asyncpg (асинхронный путь чтения в asgi.py)
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    statement_timeout = config['DB_STATEMENT_TIMEOUT_MS']
+    if config['DB_TRANSACTION_POOLER']:
+        # asyncpg и диалект SQLAlchemy кэшируют подготовленные запросы на соединении
+        options['connect_args'] = {'statement_cache_size': 0, 'prepared_statement_cache_size': 0}
+    elif statement_timeout:
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(int(statement_timeout))}}
+    return options
+
+
+def init_engine(engine, config):
+    if engine.dialect.name != 'postgresql':
+        return
+
+    if isinstance(engine.pool, TimedQueuePool):
+        # События пула, привязанные к engine, сохраняются и после engine.dispose()
+        event.listen(engine, 'connect', lambda *_: pool_stats.record_connect())
+        event.listen(engine, 'invalidate', lambda *_: pool_stats.record_invalidation())
+
+    statement_timeout = config['DB_STATEMENT_TIMEOUT_MS']
+    if config['DB_TRANSACTION_POOLER'] and statement_timeout:
+        @event.listens_for(engine, 'begin')
+        def set_statement_timeout(connection):
+            timeout = connection.info.get('statement_timeout', statement_timeout)
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+
+
+@contextmanager
+def statement_timeout_disabled(connection, config):
+    # Для долгих операций вроде миграций, в том числе вне одной транзакции (autocommit_block).
+    # Через пулер SET без LOCAL достался бы другим клиентам, поэтому там значение подхватывает
+    # SET LOCAL в начале каждой транзакции. На выходе соединение возвращается в пул с прежним таймаутом
+    connection.info['statement_timeout'] = 0
+    try:
+        if not config['DB_TRANSACTION_POOLER']:
+            connection.exec_driver_sql("SET statement_timeout = 0")
+            connection.commit()
+        yield connection
+    finally:
+        connection.info.pop('statement_timeout', None)
+        if not config['DB_TRANSACTION_POOLER'] and not connection.invalidated:
+            # RESET возвращает значение из параметров подключения (-c statement_timeout)
+            connection.rollback()
+            connection.exec_driver_sql("RESET statement_timeout")
+            connection.commit()
+
+
+def engine_stats(engine):
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=max(pool.overflow(), 0),
+        )
+    stats.update(pool_stats.snapshot())
+    return stats
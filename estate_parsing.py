@@ -0,0 +1,96 @@
+import re
+
+from sqlalchemy import bindparam, column, func, select, table, update
+
+_NUMBER_RE = re.compile(r'[0-9]+(?:[.,][0-9]+)?')
+
+
+def parse_bedrooms(value):
+    # '3' -> 3, 'Студия' -> 0
+    if not value:
+        return None
+    value = value.strip()
+    if value.lower().startswith('студ'):
+        return 0
+    match = _NUMBER_RE.search(value)
+    return int(float(match.group().replace(',', '.'))) if match else None
+
+
+def parse_area(value):
+    # '65 м²' -> 65.0, '42,5' -> 42.5
+    if not value:
+        return None
+    match = _NUMBER_RE.search(value)
+    return float(match.group().replace(',', '.')) if match else None
+
+
+def parse_floor(value):
+    # '3/9' -> (3, 9), '5 из 12' -> (5, 12), '2' -> (2, None)
+    if not value:
+        return None, None
+    numbers = re.findall(r'[0-9]+', value)
+    if not numbers:
+        return None, None
+    return int(numbers[0]), int(numbers[1]) if len(numbers) > 1 else None
+
+
+def numeric_values(bedrooms, area, floor):
+    floor_number, floors_total = parse_floor(floor)
+    return {
+        'bedrooms_count': parse_bedrooms(bedrooms),
+        'area_sqm': parse_area(area),
+        'floor_number': floor_number,
+        'floors_total': floors_total,
+    }
+
+
+_estate = table(
+    'estate',
+    column('id'), column('bedrooms'), column('area'), column('floor'),
+    column('bedrooms_count'), column('area_sqm'), column('floor_number'), column('floors_total'),
+    column('numeric_parsed'),
+)
+
+# Строки, которые ещё не разбирались. Значение, которое не удалось разобрать, остаётся NULL,
+# но строка всё равно отмечается, чтобы повторный запуск её не трогал
+_pending = _estate.c.numeric_parsed.is_(False)
+
+
+def backfill_numeric_columns(connection, batch_size=1000, commit=None, echo=print):
+    # Заполняет числовые колонки порциями по id. Уже обработанные строки пропускаются,
+    # поэтому прерванный запуск можно просто повторить
+    total = connection.execute(select(func.count()).select_from(_estate).where(_pending)).scalar()
+    echo(f"Объявлений для обработки: {total}")
+    statement = (
+        update(_estate)
+        .where(_estate.c.id == bindparam('row_id'))
+        .values(
+            bedrooms_count=bindparam('new_bedrooms_count'),
+            area_sqm=bindparam('new_area_sqm'),
+            floor_number=bindparam('new_floor_number'),
+            floors_total=bindparam('new_floors_total'),
+            numeric_parsed=True,
+        )
+    )
+    last_id = 0
+    processed = 0
+    while True:
+        rows = connection.execute(
+            select(_estate.c.id, _estate.c.bedrooms, _estate.c.area, _estate.c.floor)
+            .where(_estate.c.id > last_id, _pending)
+            .order_by(_estate.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        params = []
+        for row in rows:
+            values = numeric_values(row.bedrooms, row.area, row.floor)
+            params.append({'row_id': row.id, **{f'new_{name}': value for name, value in values.items()}})
+        connection.execute(statement, params)
+        if commit is not None:
+            commit()
+        last_id = rows[-1].id
+        processed += len(rows)
+        echo(f"Обработано {processed}/{total} (последний id {last_id})")
+    return processed
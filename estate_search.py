@@ -0,0 +1,179 @@
+import operator
+
+from markupsafe import Markup, escape
+from sqlalchemy import case, func, literal_column, select
+from sqlalchemy.orm import selectinload
+
+from models import Estate, EstatePhoto, db
+
+# Диапазоны цен из формы поиска (search.html)
+PRICE_RANGES = ['0-10000', '10000-30000', '30000-50000', '50000-100000', '100000-200000', '200000-more']
+
+# Диапазонные фильтры по числовым колонкам: параметр запроса -> (колонка, сравнение)
+RANGE_FILTERS = {
+    'bedrooms_min': (Estate.bedrooms_count, operator.ge),
+    'bedrooms_max': (Estate.bedrooms_count, operator.le),
+    'area_min': (Estate.area_sqm, operator.ge),
+    'area_max': (Estate.area_sqm, operator.le),
+    'floor_min': (Estate.floor_number, operator.ge),
+    'floor_max': (Estate.floor_number, operator.le),
+}
+
+
+# Сортировка результатов поиска; без цены объявление в сортировку по цене не попадает
+SORT_ORDERS = {
+    'price_asc': (Estate.cost_usd.asc(), Estate.id),
+    'price_desc': (Estate.cost_usd.desc(), Estate.id),
+}
+
+
+def range_filters_from_args(args):
+    ranges = {}
+    for name in RANGE_FILTERS:
+        value = args.get(name, type=float)
+        if value is not None:
+            ranges[name] = value
+    return ranges
+
+
+def parse_price_range(price_range):
+    # '50000-100000' -> (50000, 100000), '200000-more' -> (200000, None)
+    if not price_range:
+        return None
+    min_price, max_price = price_range.split('-')
+    if max_price == 'more':
+        return int(min_price), None
+    return int(min_price), int(max_price)
+
+
+def price_condition(column, price_range, literal=False):
+    min_price, max_price = parse_price_range(price_range)
+    if literal:
+        # Константы вместо параметров, чтобы одно и то же выражение совпадало в SELECT и GROUP BY
+        min_price = literal_column(str(min_price))
+        max_price = literal_column(str(max_price)) if max_price is not None else None
+    if max_price is None:
+        return column >= min_price
+    return column.between(min_price, max_price)
+
+
+def price_bucket(column):
+    # Диапазон цен, в который попадает объявление (первый подходящий, как в форме поиска)
+    return case(
+        *[(price_condition(column, price_range, literal=True), literal_column(f"'{price_range}'"))
+          for price_range in PRICE_RANGES]
+    )
+
+
+def text_query(q):
+    # Синтаксис как у поисковиков: слова, "фразы", -исключения
+    return func.websearch_to_tsquery('russian', q)
+
+
+def text_rank(q):
+    return func.ts_rank_cd(Estate.search_vector, text_query(q))
+
+
+def search_conditions(price_range, bedroom, estate_type, ranges=None, q=None):
+    # Условия фильтрации, общие для страницы поиска и API каталога
+    conditions = []
+    if q:
+        conditions.append(Estate.search_vector.op('@@')(text_query(q)))
+    if bedroom:
+        conditions.append(Estate.bedrooms == bedroom)
+    if estate_type:
+        conditions.append(Estate.type == estate_type)
+    if price_range:
+        conditions.append(price_condition(Estate.cost_usd, price_range))
+    for name, value in (ranges or {}).items():
+        column, compare = RANGE_FILTERS[name]
+        conditions.append(compare(column, value))
+    return conditions
+
+
+def search_order(sort=None, q=None):
+    # Без явной сортировки текстовый поиск упорядочивается по релевантности
+    if sort:
+        return SORT_ORDERS[sort]
+    if q:
+        return (text_rank(q).desc(), Estate.id)
+    return (Estate.id,)
+
+
+def facet_query(price_range, bedroom, estate_type, ranges=None, q=None):
+    # Количество объявлений по типу, комнатам и диапазону цен одним запросом с GROUPING SETS
+    bucket = price_bucket(Estate.cost_usd)
+    return (
+        select(
+            Estate.type,
+            Estate.bedrooms,
+            bucket.label('price_range'),
+            func.grouping(Estate.type).label('by_type'),
+            func.grouping(Estate.bedrooms).label('by_bedrooms'),
+            func.count().label('count'),
+        )
+        .where(*search_conditions(price_range, bedroom, estate_type, ranges, q))
+        .group_by(func.grouping_sets(Estate.type, Estate.bedrooms, bucket))
+    )
+
+
+def facets_from_rows(rows):
+    facets = {'type': {}, 'bedrooms': {}, 'price_range': {}}
+    for row in rows:
+        if row.by_type == 0:
+            facet, value = 'type', row.type
+        elif row.by_bedrooms == 0:
+            facet, value = 'bedrooms', row.bedrooms
+        else:
+            facet, value = 'price_range', row.price_range
+        if value is not None:
+            facets[facet][value] = row.count
+    facets['total'] = sum(facets['type'].values())
+    return facets
+
+
+def facet_counts(price_range, bedroom, estate_type, ranges=None, q=None):
+    return facets_from_rows(db.session.execute(facet_query(price_range, bedroom, estate_type, ranges, q)))
+
+
+# Служебные символы вместо <mark>, чтобы экранировать текст объявления до подсветки
+_HIGHLIGHT_START = '\x01'
+_HIGHLIGHT_STOP = '\x02'
+
+
+def highlight_snippets(ids, q):
+    # Фрагменты описания с подсвеченными совпадениями, только для объявлений текущей страницы
+    if not ids or not q:
+        return {}
+    options = f'StartSel={_HIGHLIGHT_START}, StopSel={_HIGHLIGHT_STOP}, MaxFragments=2, MaxWords=25, MinWords=8'
+    source = func.coalesce(Estate.description, '') + ' ' + func.coalesce(Estate.additional_information, '')
+    rows = db.session.query(
+        Estate.id, func.ts_headline('russian', source, text_query(q), options)
+    ).filter(Estate.id.in_(ids))
+    return {
+        estate_id: Markup(str(escape(snippet)).replace(_HIGHLIGHT_START, '<mark>').replace(_HIGHLIGHT_STOP, '</mark>'))
+        for estate_id, snippet in rows
+    }
+
+
+def listing_query():
+    # Объявления для списков: обложки всей страницы подгружаются одним дополнительным запросом
+    return Estate.query.options(selectinload(Estate.cover_photo))
+
+
+def cover_photo_filename():
+    return (
+        select(EstatePhoto.filename)
+        .where(EstatePhoto.estate_id == Estate.id)
+        .order_by(EstatePhoto.position)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def load_estates_by_ids(ids):
+    # Загружает объявления одним запросом, сохраняя порядок ids
+    if not ids:
+        return []
+    estates = {estate.id: estate for estate in listing_query().filter(Estate.id.in_(ids))}
+    return [estates[estate_id] for estate_id in ids if estate_id in estates]
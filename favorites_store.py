@@ -0,0 +1,73 @@
+import time
+
+from flask import session
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+
+from cache import TTLCache
+from models import Favorite, db
+
+FAVORITES_CACHE_TTL = 60
+FAVORITES_CACHE_SIZE = 10000
+
+# Множество id избранных объявлений по user_id вместе со временем чтения: (read_at, ids).
+# Изменение избранного удаляет один ключ в своём процессе. Сессия, изменившая избранное,
+# хранит время изменения и в любом процессе не примет набор, прочитанный раньше.
+# Другие сессии того же пользователя в других процессах видят старый набор не дольше FAVORITES_CACHE_TTL
+favorite_ids_cache = TTLCache(ttl=FAVORITES_CACHE_TTL, maxsize=FAVORITES_CACHE_SIZE)
+
+
+def favorite_ids(user_id, changed_at=0.0):
+    def compute():
+        read_at = time.time()
+        return read_at, frozenset(
+            db.session.execute(select(Favorite.estate_id).where(Favorite.user_id == user_id)).scalars()
+        )
+
+    entry = favorite_ids_cache.get(user_id)
+    if entry is None or entry[0] < changed_at:
+        entry = favorite_ids_cache.get_or_compute(user_id, compute)
+        if entry[0] < changed_at:
+            # Дождались чтения, начатого до изменения
+            entry = compute()
+            favorite_ids_cache.set(user_id, entry)
+    return entry[1]
+
+
+def current_favorite_ids():
+    user_id = session.get('user_id')
+    if not session.get('user_logged_in') or not user_id:
+        return frozenset()
+    return favorite_ids(user_id, session.get('favorites_changed_at', 0.0))
+
+
+def _favorites_changed(user_id):
+    # Набор пересчитывается при следующем чтении: выводить его из закэшированного нельзя,
+    # тот мог быть прочитан до изменений из другой сессии
+    session['favorites_changed_at'] = time.time()
+    favorite_ids_cache.delete(user_id)
+
+
+def add_favorite(user_id, estate_id):
+    # Один INSERT ... ON CONFLICT DO NOTHING вместо SELECT и INSERT
+    added = db.session.execute(
+        insert(Favorite)
+        .values(user_id=user_id, estate_id=estate_id)
+        .on_conflict_do_nothing(index_elements=['user_id', 'estate_id'])
+        .returning(Favorite.id)
+    ).first() is not None
+    db.session.commit()
+    _favorites_changed(user_id)
+    return added
+
+
+def remove_favorite(user_id, estate_id):
+    # Один DELETE ... RETURNING вместо SELECT и DELETE
+    removed = db.session.execute(
+        delete(Favorite)
+        .where(Favorite.user_id == user_id, Favorite.estate_id == estate_id)
+        .returning(Favorite.id)
+    ).first() is not None
+    db.session.commit()
+    _favorites_changed(user_id)
+    return removed
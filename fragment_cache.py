@@ -0,0 +1,27 @@
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from cache import TTLCache
+
+FRAGMENT_CACHE_TTL = 600
+FRAGMENT_CACHE_SIZE = 5000
+
+# Отрендеренные фрагменты шаблонов. Ключ включает версию данных (например, updated_at),
+# поэтому устаревшие записи не инвалидируются явно, а вытесняются по LRU и TTL
+fragment_cache = TTLCache(ttl=FRAGMENT_CACHE_TTL, maxsize=FRAGMENT_CACHE_SIZE)
+
+
+class FragmentCacheExtension(Extension):
+    # {% cache 'estate-card', estate.id, estate.updated_at %} ... {% endcache %}
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(key)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        return fragment_cache.get_or_compute(tuple(key), caller)
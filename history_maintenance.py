@@ -0,0 +1,139 @@
+import logging
+import re
+from datetime import date
+
+from sqlalchemy import delete, select, text, tuple_
+
+from models import ViewHistory, db
+
+logger = logging.getLogger(__name__)
+
+_PARTITION_RE = re.compile(r'^view_history_(\d{4})_(\d{2})$')
+# Секция для строк, месяцу которых не нашлось своей секции
+DEFAULT_PARTITION = 'view_history_default'
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"view_history_{month:%Y_%m}"
+
+
+def is_partitioned(connection):
+    relkind = connection.execute(text("SELECT relkind FROM pg_class WHERE relname = 'view_history'")).scalar()
+    return relkind == 'p'
+
+
+def default_partition_rows(connection, start=None, end=None):
+    # Число строк в секции по умолчанию (в диапазоне [start, end), если он задан)
+    if connection.execute(text("SELECT to_regclass(:name)"), {'name': DEFAULT_PARTITION}).scalar() is None:
+        return 0
+    query = f"SELECT count(*) FROM {DEFAULT_PARTITION}"
+    if start is not None:
+        query += " WHERE timestamp >= :start AND timestamp < :end"
+    return connection.execute(text(query), {'start': start, 'end': end}).scalar()
+
+
+def _create_partition(connection, name, month):
+    # Postgres не создаст секцию, если строки её месяца уже лежат в секции по умолчанию.
+    # Тогда секция по умолчанию отсоединяется, строки переносятся в новую секцию, и она присоединяется обратно
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    create = text(
+        f"CREATE TABLE {name} PARTITION OF view_history FOR VALUES FROM ('{start}') TO ('{end}')"
+    )
+    stray_rows = default_partition_rows(connection, start, end)
+    if not stray_rows:
+        connection.execute(create)
+        return
+    connection.execute(text(f"ALTER TABLE view_history DETACH PARTITION {DEFAULT_PARTITION}"))
+    connection.execute(create)
+    bounds = {'start': start, 'end': end}
+    connection.execute(text(
+        f"INSERT INTO view_history (id, user_id, estate_id, timestamp) "
+        f"SELECT id, user_id, estate_id, timestamp FROM {DEFAULT_PARTITION} "
+        f"WHERE timestamp >= :start AND timestamp < :end"
+    ), bounds)
+    connection.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end"), bounds)
+    connection.execute(text(f"ALTER TABLE view_history ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    logger.info("В секцию %s перенесено %d строк из %s", name, stray_rows, DEFAULT_PARTITION)
+
+
+def ensure_partitions(connection, months_ahead=3, start=None):
+    # Создаёт месячные секции от start (по умолчанию текущий месяц) на months_ahead месяцев вперёд
+    if not is_partitioned(connection):
+        return []
+    first_month = month_start(start or date.today())
+    last_month = add_months(month_start(date.today()), months_ahead)
+    created = []
+    month = first_month
+    while month <= last_month:
+        name = partition_name(month)
+        exists = connection.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar()
+        if exists is None:
+            _create_partition(connection, name, month)
+            created.append(name)
+        month = add_months(month, 1)
+    stray_rows = default_partition_rows(connection)
+    if stray_rows:
+        # Строки вне созданных секций: обслуживание не запускалось вовремя или часы сервера ушли вперёд
+        logger.warning("В секции %s %d строк без своей месячной секции", DEFAULT_PARTITION, stray_rows)
+    return created
+
+
+def retention_cutoff(retention_months):
+    return add_months(month_start(date.today()), -retention_months)
+
+
+def drop_old_partitions(connection, retention_months):
+    # Удаляет целые секции старше срока хранения: это быстрее и дешевле, чем DELETE по строкам
+    if not is_partitioned(connection):
+        return []
+    cutoff = retention_cutoff(retention_months)
+    names = connection.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'view_history'
+    """)).scalars().all()
+    dropped = []
+    for name in sorted(names):
+        match = _PARTITION_RE.match(name)
+        if not match:
+            continue
+        month = date(int(match.group(1)), int(match.group(2)), 1)
+        if add_months(month, 1) <= cutoff:
+            connection.execute(text(f"ALTER TABLE view_history DETACH PARTITION {name}"))
+            connection.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    return dropped
+
+
+def purge_default_partition(connection, retention_months):
+    # Секция по умолчанию не удаляется целиком, старые строки из неё удаляются по сроку хранения
+    if not is_partitioned(connection) or not default_partition_rows(connection):
+        return 0
+    return connection.execute(
+        text(f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp < :cutoff"),
+        {'cutoff': retention_cutoff(retention_months)},
+    ).rowcount
+
+
+def clear_user_history(user_id, batch_size=5000):
+    # Удаление порциями, чтобы не держать долгую транзакцию и блокировки на большой истории
+    table = ViewHistory.__table__
+    deleted = 0
+    while True:
+        batch = select(table.c.id, table.c.timestamp).where(table.c.user_id == user_id).limit(batch_size)
+        result = db.session.execute(delete(table).where(tuple_(table.c.id, table.c.timestamp).in_(batch)))
+        db.session.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
@@ -0,0 +1,179 @@
+import atexit
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import url_for
+from markupsafe import Markup
+from PIL import Image, ImageOps
+
+from cache import TTLCache
+from fragment_cache import fragment_cache
+from models import EstatePhoto, db
+
+logger = logging.getLogger(__name__)
+
+# Варианты фотографии: название -> максимальная ширина в пикселях
+IMAGE_VARIANTS = {
+    'thumb': 320,
+    'card': 640,
+    'full': 1600,
+}
+RESIZED_DIR = 'resized'
+JPEG_QUALITY = 80
+WEBP_QUALITY = 75
+# Сколько секунд помнить, что у фото ещё нет уменьшенных копий
+MISSING_VARIANTS_TTL = 60
+
+
+def variant_filename(filename, variant, ext='jpg'):
+    # Расширение оригинала входит в имя: копии a.jpg и a.png не перезаписывают друг друга
+    stem, source_ext = os.path.splitext(os.path.basename(filename))
+    if source_ext:
+        stem = f"{stem}-{source_ext[1:].lower()}"
+    return f"{RESIZED_DIR}/{stem}-{variant}.{ext}"
+
+
+def image_info(path):
+    # Размеры читаются из заголовка файла, без декодирования изображения
+    if not os.path.exists(path):
+        return None, None, None
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+    except OSError:
+        width = height = None
+    return width, height, os.path.getsize(path)
+
+
+def make_variants(upload_dir, filename, webp=True, force=False):
+    # Выполняется в отдельном процессе, поэтому работает только с файлами
+    source = os.path.join(upload_dir, filename)
+    os.makedirs(os.path.join(upload_dir, RESIZED_DIR), exist_ok=True)
+    written = []
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    source_mtime = os.path.getmtime(source)
+    previous_width = 0
+    for variant, width in IMAGE_VARIANTS.items():
+        # Снимки не увеличиваются: варианты крупнее оригинала не создаются
+        if image.width <= previous_width:
+            break
+        previous_width = width
+        resized = image
+        if image.width > width:
+            resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        formats = [('jpg', 'JPEG', {'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True})]
+        if webp:
+            formats.append(('webp', 'WEBP', {'quality': WEBP_QUALITY, 'method': 4}))
+        for ext, image_format, options in formats:
+            target = os.path.join(upload_dir, variant_filename(filename, variant, ext))
+            if not force and os.path.exists(target) and os.path.getmtime(target) >= source_mtime:
+                written.append(target)
+                continue
+            resized.save(target, image_format, **options)
+            written.append(target)
+    return written
+
+
+class ImagePipeline:
+    # Уменьшенные копии загруженных фотографий создаются в пуле процессов,
+    # чтобы ресайз не занимал GIL и рабочие потоки веб-сервера
+    def __init__(self):
+        self.upload_dir = None
+        self.webp = True
+        self.workers = 2
+        self._executor = None
+        self._available = {}
+        # Отрицательный кэш: без него каждая карточка без копий проверяла бы файлы на диске
+        self._missing = TTLCache(ttl=MISSING_VARIANTS_TTL, maxsize=10000)
+
+    def init_app(self, app):
+        self.upload_dir = app.config.get('UPLOAD_FOLDER', os.path.join(app.root_path, 'static', 'uploads'))
+        self.webp = app.config.get('IMAGE_VARIANTS_WEBP', True)
+        self.workers = app.config.get('IMAGE_WORKERS', 2)
+        app.add_template_global(self.responsive_image)
+        atexit.register(self.shutdown)
+
+    def attach(self, estate, filename):
+        # Новое фото добавляется в конец списка фотографий объявления
+        width, height, byte_size = image_info(os.path.join(self.upload_dir, filename))
+        position = max((photo.position for photo in estate.photos), default=-1) + 1
+        photo = EstatePhoto(filename=filename, position=position, width=width, height=height, byte_size=byte_size)
+        estate.photos.append(photo)
+        estate.updated_at = db.func.now()
+        return photo
+
+    def _get_executor(self):
+        # Пул создаётся лениво, уже в рабочем процессе веб-сервера
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def submit(self, filenames, force=False):
+        futures = []
+        for filename in filenames:
+            self._available.pop(filename, None)
+            self._missing.delete(filename)
+            future = self._get_executor().submit(make_variants, self.upload_dir, filename, self.webp, force)
+            future.add_done_callback(lambda f, name=filename: self._on_done(f, name))
+            futures.append(future)
+        return futures
+
+    def _on_done(self, future, filename):
+        if future.exception() is not None:
+            logger.error("Не удалось обработать фото %s: %s", filename, future.exception())
+            return
+        # Карточки, закэшированные до появления уменьшенных копий, ссылаются на оригинал
+        self._available.pop(filename, None)
+        self._missing.delete(filename)
+        fragment_cache.clear()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def variants(self, filename):
+        # Готовые варианты: ([(название, ширина)], есть ли WebP).
+        # Найденные запоминаются, отсутствующие проверяются снова не чаще раза в MISSING_VARIANTS_TTL
+        cached = self._available.get(filename) or self._missing.get(filename)
+        if cached is not None:
+            return cached
+        found = [
+            (variant, width) for variant, width in IMAGE_VARIANTS.items()
+            if os.path.exists(os.path.join(self.upload_dir, variant_filename(filename, variant)))
+        ]
+        has_webp = bool(found) and os.path.exists(
+            os.path.join(self.upload_dir, variant_filename(filename, found[0][0], 'webp')))
+        if found:
+            self._available[filename] = (found, has_webp)
+        else:
+            self._missing.set(filename, (found, has_webp))
+        return found, has_webp
+
+    def responsive_image(self, filename, sizes='100vw', alt='', css_class='img-responsive'):
+        found, has_webp = self.variants(filename)
+        if not found:
+            return Markup('<img src="{}" class="{}" alt="{}" loading="lazy">').format(
+                url_for('static', filename='uploads/' + filename), css_class, alt)
+
+        def srcset(ext):
+            return ', '.join(
+                f"{url_for('static', filename='uploads/' + variant_filename(filename, variant, ext))} {width}w"
+                for variant, width in found
+            )
+
+        webp_source = Markup('')
+        if has_webp:
+            webp_source = Markup('<source type="image/webp" srcset="{}" sizes="{}">').format(srcset('webp'), sizes)
+        return Markup(
+            '<picture>{}<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" loading="lazy" decoding="async"></picture>'
+        ).format(
+            webp_source,
+            url_for('static', filename='uploads/' + variant_filename(filename, found[0][0])),
+            srcset('jpg'), sizes, css_class, alt,
+        )
+
+
+image_pipeline = ImagePipeline()
@@ -0,0 +1,139 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Атрибуты LogRecord, которые не попадают в JSON как дополнительные поля (extra=...)
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+_EXCEPTION_FORMATTER = logging.Formatter()
+
+
+class JsonFormatter(logging.Formatter):
+    # Одна запись — одна строка JSON; поля из extra=... добавляются как есть
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES:
+                data[name] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Запись из очереди: исключение уже отформатировано в prepare
+            data['exc_info'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    # Из логгера (и его потомков) проходит только доля записей ниже WARNING:
+    # {'sqlalchemy.engine': 0.01, 'routes': 0.1}
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def rate_for(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    # Запись в очередь не ждёт диска; при переполненной очереди запись отбрасывается
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        # Полное форматирование (Formatter.format) остаётся потоку слушателя, но подстановка
+        # аргументов и traceback делаются здесь: аргументы могут измениться, пока запись в очереди,
+        # а traceback держит ссылки на кадры стека запроса
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = (self.formatter or _EXCEPTION_FORMATTER).formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+
+def parse_sampling(value):
+    # 'sqlalchemy.engine=0.01,routes=0.1' -> {'sqlalchemy.engine': 0.01, 'routes': 0.1}
+    rates = {}
+    for item in (value or '').split(','):
+        name, _, rate = item.partition('=')
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+class LoggingSetup:
+    def __init__(self):
+        self.handler = None
+        self.listener = None
+
+    def init_app(self, app):
+        config = app.config
+        if config['LOG_FILE']:
+            output = logging.FileHandler(config['LOG_FILE'], encoding='utf-8')
+        else:
+            output = logging.StreamHandler(sys.stderr)
+        if config['LOG_FORMAT'] == 'json':
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=config['LOG_QUEUE_SIZE']))
+        handler.addFilter(SamplingFilter(parse_sampling(config['LOG_SAMPLING'])))
+
+        # Повторный create_app (тесты, бенчмарки) заменяет обработчик, а не добавляет второй
+        self.stop()
+        root = logging.getLogger()
+        root.setLevel(config['LOG_LEVEL'])
+        root.addHandler(handler)
+        self.handler = handler
+        self.listener = QueueListener(handler.queue, output)
+        self.listener.start()
+
+    def stop(self):
+        # Дописывает оставшиеся в очереди записи
+        if self.listener is not None:
+            logging.getLogger().removeHandler(self.handler)
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+
+    def stats(self):
+        if self.handler is None:
+            return {}
+        return {'queued': self.handler.queue.qsize(), 'dropped': self.handler.dropped}
+
+
+logging_setup = LoggingSetup()
+atexit.register(logging_setup.stop)
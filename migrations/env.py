@@ -5,6 +5,8 @@ from flask import current_app
 
 from alembic import context
 
+from db_pool import statement_timeout_disabled
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -96,7 +98,8 @@ def run_migrations_online():
 
     connectable = get_engine()
 
-    with connectable.connect() as connection:
+    # Перестроение индексов и перенос данных не ограничиваются DB_STATEMENT_TIMEOUT_MS
+    with connectable.connect() as connection, statement_timeout_disabled(connection, current_app.config):
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
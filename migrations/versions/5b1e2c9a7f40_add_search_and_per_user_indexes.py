@@ -0,0 +1,52 @@
+"""Add search and per-user indexes
+
+Revision ID: 5b1e2c9a7f40
+Revises: 3d574441c5ef
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '5b1e2c9a7f40'
+down_revision = '3d574441c5ef'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Повторы в избранном не дадут построить уникальный индекс
+    op.execute("""
+        DELETE FROM favorites a
+        USING favorites b
+        WHERE a.user_id = b.user_id AND a.estate_id = b.estate_id AND a.id > b.id
+    """)
+
+    # CREATE INDEX CONCURRENTLY не блокирует запись, но не может выполняться внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index('ix_estate_type_bedrooms_cost', 'estate', ['type', 'bedrooms', 'cost'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_estate_bedrooms_cost', 'estate', ['bedrooms', 'cost'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_estate_cost', 'estate', ['cost'],
+                        postgresql_where=sa.text('cost IS NOT NULL'),
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_view_history_user_timestamp', 'view_history', ['user_id', 'timestamp'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_view_history_user_estate', 'view_history', ['user_id', 'estate_id'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('uq_favorites_user_estate', 'favorites', ['user_id', 'estate_id'], unique=True,
+                        postgresql_concurrently=True, if_not_exists=True)
+        # Ограничение использует уже построенный индекс, поэтому таблица блокируется лишь на мгновение
+        op.execute('ALTER TABLE favorites ADD CONSTRAINT uq_favorites_user_estate UNIQUE USING INDEX uq_favorites_user_estate')
+
+
+def downgrade():
+    op.drop_constraint('uq_favorites_user_estate', 'favorites', type_='unique')
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_view_history_user_estate', table_name='view_history', postgresql_concurrently=True)
+        op.drop_index('ix_view_history_user_timestamp', table_name='view_history', postgresql_concurrently=True)
+        op.drop_index('ix_estate_cost', table_name='estate', postgresql_concurrently=True)
+        op.drop_index('ix_estate_bedrooms_cost', table_name='estate', postgresql_concurrently=True)
+        op.drop_index('ix_estate_type_bedrooms_cost', table_name='estate', postgresql_concurrently=True)
@@ -0,0 +1,131 @@
+"""Add numeric bedrooms, area and floor columns to estate
+
+Revision ID: 8c3f6d21a9e4
+Revises: 5b1e2c9a7f40
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+import logging
+import os
+import re
+
+from alembic import op
+from sqlalchemy import bindparam, column, func, select, table, update
+
+# revision identifiers, used by Alembic.
+revision = '8c3f6d21a9e4'
+down_revision = '5b1e2c9a7f40'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic')
+
+# Копия разбора из estate_parsing на момент миграции: дальнейшие изменения модуля её не меняют
+_NUMBER_RE = re.compile(r'[0-9]+(?:[.,][0-9]+)?')
+
+
+def _parse_bedrooms(value):
+    if not value:
+        return None
+    value = value.strip()
+    if value.lower().startswith('студ'):
+        return 0
+    match = _NUMBER_RE.search(value)
+    return int(float(match.group().replace(',', '.'))) if match else None
+
+
+def _parse_area(value):
+    if not value:
+        return None
+    match = _NUMBER_RE.search(value)
+    return float(match.group().replace(',', '.')) if match else None
+
+
+def _parse_floor(value):
+    if not value:
+        return None, None
+    numbers = re.findall(r'[0-9]+', value)
+    if not numbers:
+        return None, None
+    return int(numbers[0]), int(numbers[1]) if len(numbers) > 1 else None
+
+
+_estate = table(
+    'estate',
+    column('id'), column('bedrooms'), column('area'), column('floor'),
+    column('bedrooms_count'), column('area_sqm'), column('floor_number'), column('floors_total'),
+    column('numeric_parsed'),
+)
+
+
+def _backfill(connection, batch_size):
+    # Порции по id; каждая строка отмечается разобранной, даже если значение не распозналось
+    pending = _estate.c.numeric_parsed.is_(False)
+    total = connection.execute(select(func.count()).select_from(_estate).where(pending)).scalar()
+    logger.info("Объявлений для обработки: %s", total)
+    statement = (
+        update(_estate)
+        .where(_estate.c.id == bindparam('row_id'))
+        .values(
+            bedrooms_count=bindparam('new_bedrooms_count'),
+            area_sqm=bindparam('new_area_sqm'),
+            floor_number=bindparam('new_floor_number'),
+            floors_total=bindparam('new_floors_total'),
+            numeric_parsed=True,
+        )
+    )
+    last_id = 0
+    processed = 0
+    while True:
+        rows = connection.execute(
+            select(_estate.c.id, _estate.c.bedrooms, _estate.c.area, _estate.c.floor)
+            .where(_estate.c.id > last_id, pending)
+            .order_by(_estate.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        params = []
+        for row in rows:
+            floor_number, floors_total = _parse_floor(row.floor)
+            params.append({
+                'row_id': row.id,
+                'new_bedrooms_count': _parse_bedrooms(row.bedrooms),
+                'new_area_sqm': _parse_area(row.area),
+                'new_floor_number': floor_number,
+                'new_floors_total': floors_total,
+            })
+        connection.execute(statement, params)
+        last_id = rows[-1].id
+        processed += len(rows)
+        logger.info("Обработано %s/%s (последний id %s)", processed, total, last_id)
+
+
+def upgrade():
+    # IF NOT EXISTS позволяет повторно запустить миграцию, если заполнение было прервано
+    op.execute('ALTER TABLE estate ADD COLUMN IF NOT EXISTS bedrooms_count INTEGER')
+    op.execute('ALTER TABLE estate ADD COLUMN IF NOT EXISTS area_sqm DOUBLE PRECISION')
+    op.execute('ALTER TABLE estate ADD COLUMN IF NOT EXISTS floor_number INTEGER')
+    op.execute('ALTER TABLE estate ADD COLUMN IF NOT EXISTS floors_total INTEGER')
+    # Значение по умолчанию-константа не переписывает таблицу
+    op.execute('ALTER TABLE estate ADD COLUMN IF NOT EXISTS numeric_parsed BOOLEAN NOT NULL DEFAULT false')
+
+    # Каждая порция фиксируется отдельно, размер задаётся BACKFILL_BATCH_SIZE
+    with op.get_context().autocommit_block():
+        _backfill(op.get_bind(), int(os.environ.get('BACKFILL_BATCH_SIZE', 1000)))
+        op.create_index('ix_estate_bedrooms_count', 'estate', ['bedrooms_count'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_estate_area_sqm', 'estate', ['area_sqm'],
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_estate_area_sqm', table_name='estate', postgresql_concurrently=True)
+        op.drop_index('ix_estate_bedrooms_count', table_name='estate', postgresql_concurrently=True)
+    with op.batch_alter_table('estate', schema=None) as batch_op:
+        batch_op.drop_column('numeric_parsed')
+        batch_op.drop_column('floors_total')
+        batch_op.drop_column('floor_number')
+        batch_op.drop_column('area_sqm')
+        batch_op.drop_column('bedrooms_count')
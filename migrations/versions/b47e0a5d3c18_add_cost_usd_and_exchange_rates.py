@@ -0,0 +1,72 @@
+"""Add exchange_rates table and currency-normalized estate.cost_usd
+
+Revision ID: b47e0a5d3c18
+Revises: 8c3f6d21a9e4
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'b47e0a5d3c18'
+down_revision = '8c3f6d21a9e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    exchange_rates = op.create_table('exchange_rates',
+        sa.Column('currency', sa.String(length=10), nullable=False),
+        sa.Column('rate_to_usd', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('currency')
+    )
+    # Начальный курс BYN нужно уточнить в админке ("Курсы валют") или командой flask set-exchange-rate
+    op.bulk_insert(exchange_rates, [
+        {'currency': 'USD', 'rate_to_usd': 1.0},
+        {'currency': 'BYN', 'rate_to_usd': 0.31},
+    ])
+
+    with op.batch_alter_table('estate', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cost_usd', sa.Float(), nullable=True))
+
+    # Все цены пересчитываются одним UPDATE, а не построчно
+    op.execute("""
+        UPDATE estate
+        SET cost_usd = estate.cost * r.rate_to_usd
+        FROM exchange_rates r
+        WHERE r.currency = coalesce(estate.currency, 'USD')
+    """)
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_estate_type_bedrooms_cost_usd', 'estate', ['type', 'bedrooms', 'cost_usd'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_estate_bedrooms_cost_usd', 'estate', ['bedrooms', 'cost_usd'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_estate_cost_usd', 'estate', ['cost_usd'],
+                        postgresql_where=sa.text('cost_usd IS NOT NULL'),
+                        postgresql_concurrently=True, if_not_exists=True)
+        # Фильтры по цене теперь идут по cost_usd, индексы по cost больше не нужны
+        op.drop_index('ix_estate_cost', table_name='estate', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_estate_bedrooms_cost', table_name='estate', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_estate_type_bedrooms_cost', table_name='estate', postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_estate_type_bedrooms_cost', 'estate', ['type', 'bedrooms', 'cost'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_estate_bedrooms_cost', 'estate', ['bedrooms', 'cost'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_estate_cost', 'estate', ['cost'],
+                        postgresql_where=sa.text('cost IS NOT NULL'),
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_estate_cost_usd', table_name='estate', postgresql_concurrently=True)
+        op.drop_index('ix_estate_bedrooms_cost_usd', table_name='estate', postgresql_concurrently=True)
+        op.drop_index('ix_estate_type_bedrooms_cost_usd', table_name='estate', postgresql_concurrently=True)
+
+    with op.batch_alter_table('estate', schema=None) as batch_op:
+        batch_op.drop_column('cost_usd')
+
+    op.drop_table('exchange_rates')
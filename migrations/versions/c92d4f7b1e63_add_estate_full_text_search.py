@@ -0,0 +1,35 @@
+"""Add full-text search vector over location and description
+
+Revision ID: c92d4f7b1e63
+Revises: b47e0a5d3c18
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'c92d4f7b1e63'
+down_revision = 'b47e0a5d3c18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Сохраняемая вычисляемая колонка (PostgreSQL 12+); добавление перезаписывает таблицу estate
+    op.execute("""
+        ALTER TABLE estate ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('russian', coalesce(location, '')), 'A') ||
+            setweight(to_tsvector('russian', coalesce(description, '')), 'B') ||
+            setweight(to_tsvector('russian', coalesce(additional_information, '')), 'C')
+        ) STORED
+    """)
+    with op.get_context().autocommit_block():
+        op.create_index('ix_estate_search_vector', 'estate', ['search_vector'], postgresql_using='gin',
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_estate_search_vector', table_name='estate', postgresql_concurrently=True)
+    with op.batch_alter_table('estate', schema=None) as batch_op:
+        batch_op.drop_column('search_vector')
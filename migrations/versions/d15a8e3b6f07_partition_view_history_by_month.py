@@ -0,0 +1,110 @@
+"""Partition view_history by month and collapse repeated views
+
+Revision ID: d15a8e3b6f07
+Revises: c92d4f7b1e63
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+import os
+from datetime import date
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'd15a8e3b6f07'
+down_revision = 'c92d4f7b1e63'
+branch_labels = None
+depends_on = None
+
+# Месячные секции создаются здесь же, а не через history_maintenance: дальнейшие изменения модуля миграцию не меняют
+MONTHS_AHEAD = 3
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _create_month_partitions(first_day):
+    # Секции от месяца first_day до текущего месяца плюс MONTHS_AHEAD; секция по умолчанию пока пуста
+    today = date.today()
+    month = date(first_day.year, first_day.month, 1)
+    last_month = _add_months(date(today.year, today.month, 1), MONTHS_AHEAD)
+    while month <= last_month:
+        next_month = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE view_history_{month:%Y_%m} PARTITION OF view_history "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"
+        )
+        month = next_month
+
+
+def upgrade():
+    # Старая таблица переименовывается вместе с индексами и последовательностью, чтобы освободить имена
+    op.execute('ALTER TABLE view_history RENAME TO view_history_old')
+    op.execute('ALTER TABLE view_history_old RENAME CONSTRAINT view_history_pkey TO view_history_old_pkey')
+    op.execute('ALTER SEQUENCE view_history_id_seq RENAME TO view_history_old_id_seq')
+    op.execute('ALTER INDEX IF EXISTS ix_view_history_user_timestamp RENAME TO ix_view_history_old_user_timestamp')
+    op.execute('ALTER INDEX IF EXISTS ix_view_history_user_estate RENAME TO ix_view_history_old_user_estate')
+
+    op.execute("""
+        CREATE TABLE view_history (
+            id BIGSERIAL NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            estate_id INTEGER NOT NULL REFERENCES estate (id),
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    op.create_index('ix_view_history_user_timestamp', 'view_history', ['user_id', 'timestamp'])
+    op.create_index('ix_view_history_user_estate', 'view_history', ['user_id', 'estate_id'])
+    op.execute('CREATE TABLE view_history_default PARTITION OF view_history DEFAULT')
+
+    connection = op.get_bind()
+    oldest = connection.execute(sa.text('SELECT min(timestamp) FROM view_history_old')).scalar()
+    _create_month_partitions(oldest.date() if oldest else date.today())
+
+    # Переносим историю, схлопывая повторные просмотры одного объявления в пределах окна.
+    # Из серии остаётся последний просмотр, чтобы порядок «недавно просмотренных» не сдвигался в прошлое
+    dedup_seconds = int(os.environ.get('VIEW_HISTORY_DEDUP_SECONDS', 1800))
+    op.execute(sa.text("""
+        INSERT INTO view_history (id, user_id, estate_id, timestamp)
+        SELECT id, user_id, estate_id, viewed_at
+        FROM (
+            SELECT id, user_id, estate_id, coalesce(timestamp, now()) AS viewed_at,
+                   lead(coalesce(timestamp, now())) OVER (
+                       PARTITION BY user_id, estate_id ORDER BY coalesce(timestamp, now()), id
+                   ) AS next_view
+            FROM view_history_old
+        ) views
+        WHERE next_view IS NULL OR next_view - viewed_at >= make_interval(secs => :dedup_seconds)
+    """).bindparams(dedup_seconds=dedup_seconds))
+    op.execute("SELECT setval('view_history_id_seq', coalesce((SELECT max(id) FROM view_history_old), 0) + 1, false)")
+    op.execute('DROP TABLE view_history_old')
+
+
+def downgrade():
+    op.execute('ALTER TABLE view_history RENAME TO view_history_partitioned')
+    op.execute('ALTER SEQUENCE view_history_id_seq RENAME TO view_history_partitioned_id_seq')
+    op.execute('ALTER INDEX ix_view_history_user_timestamp RENAME TO ix_view_history_partitioned_user_timestamp')
+    op.execute('ALTER INDEX ix_view_history_user_estate RENAME TO ix_view_history_partitioned_user_estate')
+    op.execute('ALTER TABLE view_history_partitioned RENAME CONSTRAINT view_history_pkey TO view_history_partitioned_pkey')
+
+    op.create_table('view_history',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('estate_id', sa.Integer(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['estate_id'], ['estate.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("""
+        INSERT INTO view_history (id, user_id, estate_id, timestamp)
+        SELECT id, user_id, estate_id, timestamp FROM view_history_partitioned
+    """)
+    op.execute("SELECT setval('view_history_id_seq', coalesce((SELECT max(id) FROM view_history), 0) + 1, false)")
+    op.create_index('ix_view_history_user_timestamp', 'view_history', ['user_id', 'timestamp'])
+    op.create_index('ix_view_history_user_estate', 'view_history', ['user_id', 'estate_id'])
+    op.execute('DROP TABLE view_history_partitioned CASCADE')
@@ -0,0 +1,66 @@
+"""Move comma-joined estate.photo into an ordered estate_photos table
+
+Revision ID: e4b81f6c2d95
+Revises: d15a8e3b6f07
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e4b81f6c2d95'
+down_revision = 'd15a8e3b6f07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'estate_photos',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('estate_id', sa.Integer(), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('width', sa.Integer(), nullable=True),
+        sa.Column('height', sa.Integer(), nullable=True),
+        sa.Column('byte_size', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['estate_id'], ['estate.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('estate_id', 'position', name='uq_estate_photos_estate_position',
+                            deferrable=True, initially='DEFERRED'),
+    )
+
+    # Пустые элементы списка пропускаются, позиции нумеруются подряд с нуля
+    op.execute("""
+        INSERT INTO estate_photos (estate_id, filename, position)
+        SELECT estate_id, filename, row_number() OVER (PARTITION BY estate_id ORDER BY ordinality) - 1
+        FROM (
+            SELECT estate.id AS estate_id, trim(photo.filename) AS filename, photo.ordinality
+            FROM estate
+            CROSS JOIN LATERAL unnest(string_to_array(estate.photo, ',')) WITH ORDINALITY AS photo(filename, ordinality)
+            WHERE estate.photo IS NOT NULL
+        ) photos
+        WHERE filename <> ''
+    """)
+
+    with op.batch_alter_table('estate', schema=None) as batch_op:
+        batch_op.drop_column('photo')
+
+
+def downgrade():
+    with op.batch_alter_table('estate', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('photo', sa.Text(), nullable=True))
+
+    op.execute("""
+        UPDATE estate
+        SET photo = photos.filenames
+        FROM (
+            SELECT estate_id, string_agg(filename, ',' ORDER BY position) AS filenames
+            FROM estate_photos
+            GROUP BY estate_id
+        ) photos
+        WHERE estate.id = photos.estate_id
+    """)
+
+    op.drop_table('estate_photos')
@@ -0,0 +1,37 @@
+"""Add estate.updated_at and a global catalog_version row
+
+Revision ID: f3c9a1d7e520
+Revises: e4b81f6c2d95
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'f3c9a1d7e520'
+down_revision = 'e4b81f6c2d95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Значение по умолчанию задаётся на стороне сервера, существующие строки получают now() без переписывания таблицы
+    with op.batch_alter_table('estate', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+
+    op.create_table(
+        'catalog_version',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.execute("INSERT INTO catalog_version (id, version, updated_at) VALUES (1, 1, now())")
+
+
+def downgrade():
+    op.drop_table('catalog_version')
+
+    with op.batch_alter_table('estate', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
@@ -1,8 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, select
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import relationship
 from werkzeug.security import check_password_hash
 
-db = SQLAlchemy()
+from estate_parsing import numeric_values
+from replica import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -27,24 +32,114 @@ class Administrator(db.Model):
     def check_password(self, password):
         return check_password_hash(self.password, password)
 
+ESTATE_SEARCH_VECTOR = (
+    "setweight(to_tsvector('russian', coalesce(location, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(description, '')), 'B') || "
+    "setweight(to_tsvector('russian', coalesce(additional_information, '')), 'C')"
+)
+
 class Estate(db.Model):
     __tablename__ = 'estate'
+    # Индексы под фильтры perform_search
+    __table_args__ = (
+        db.Index('ix_estate_type_bedrooms_cost_usd', 'type', 'bedrooms', 'cost_usd'),
+        db.Index('ix_estate_bedrooms_cost_usd', 'bedrooms', 'cost_usd'),
+        db.Index('ix_estate_cost_usd', 'cost_usd', postgresql_where=db.text('cost_usd IS NOT NULL')),
+        db.Index('ix_estate_bedrooms_count', 'bedrooms_count'),
+        db.Index('ix_estate_area_sqm', 'area_sqm'),
+        db.Index('ix_estate_search_vector', 'search_vector', postgresql_using='gin'),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     type = db.Column(db.String(100), nullable=False)
     location = db.Column(db.String(200), nullable=False)
     cost = db.Column(db.Float, default=0.0)
     currency = db.Column(db.String(10), default='USD')
+    # Стоимость в долларах по курсу из exchange_rates, используется для фильтров и сортировки
+    cost_usd = db.Column(db.Float)
     bedrooms = db.Column(db.String(10))
     area = db.Column(db.String(20))
     floor = db.Column(db.String(20))
+    # Числовые значения, разобранные из bedrooms, area и floor (для диапазонов и сортировки)
+    bedrooms_count = db.Column(db.Integer)
+    area_sqm = db.Column(db.Float)
+    floor_number = db.Column(db.Integer)
+    floors_total = db.Column(db.Integer)
+    # Строка уже прошла разбор (в том числе неудачный), заполнение её пропускает
+    numeric_parsed = db.Column(db.Boolean, nullable=False, default=True, server_default=db.false())
     description = db.Column(db.Text())
     additional_information = db.Column(db.Text())
-    photo = db.Column(db.Text())
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     admin_id = db.Column(db.Integer, db.ForeignKey('administrators.id'))
+    # Время последнего изменения объявления (в том числе фото), используется для Last-Modified
+    updated_at = db.Column(db.DateTime, nullable=False, default=db.func.now(), onupdate=db.func.now(),
+                           server_default=db.func.now())
+    # Полнотекстовый индекс (русская морфология), Postgres пересчитывает его сам
+    search_vector = db.Column(TSVECTOR, db.Computed(ESTATE_SEARCH_VECTOR, persisted=True))
     user = relationship("User", back_populates="estates")
     admin = relationship("Administrator", back_populates="estates")
 
+@event.listens_for(Estate, 'before_insert')
+@event.listens_for(Estate, 'before_update')
+def sync_numeric_columns(_mapper, _connection, target):
+    for name, value in numeric_values(target.bedrooms, target.area, target.floor).items():
+        setattr(target, name, value)
+    target.numeric_parsed = True
+
+# Цены без валюты считаются в долларах; курс доллара всегда 1 и не хранится отдельно от кода
+BASE_CURRENCY = 'USD'
+
+@event.listens_for(Estate, 'before_insert')
+@event.listens_for(Estate, 'before_update')
+def sync_cost_usd(_mapper, connection, target):
+    if target.cost is None:
+        target.cost_usd = None
+        return
+    currency = target.currency or BASE_CURRENCY
+    rate = 1.0
+    if currency != BASE_CURRENCY:
+        rate = connection.execute(
+            select(ExchangeRate.rate_to_usd).where(ExchangeRate.currency == currency)
+        ).scalar()
+    # Из формы админки стоимость приходит как Decimal
+    target.cost_usd = float(target.cost) * rate if rate is not None else None
+
+class EstatePhoto(db.Model):
+    __tablename__ = 'estate_photos'
+    # Отложенная проверка позволяет менять фото местами в одной транзакции
+    __table_args__ = (
+        db.UniqueConstraint('estate_id', 'position', name='uq_estate_photos_estate_position',
+                            deferrable=True, initially='DEFERRED'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    estate_id = db.Column(db.Integer, db.ForeignKey('estate.id', ondelete='CASCADE'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    # Порядок показа, фото с наименьшей позицией — обложка
+    position = db.Column(db.Integer, nullable=False, default=0)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    byte_size = db.Column(db.Integer)
+    estate = relationship("Estate", back_populates="photos")
+
+class ExchangeRate(db.Model):
+    __tablename__ = 'exchange_rates'
+    currency = db.Column(db.String(10), primary_key=True)
+    # Сколько долларов стоит единица валюты
+    rate_to_usd = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+
+class CatalogVersion(db.Model):
+    __tablename__ = 'catalog_version'
+    # Одна строка: номер версии каталога увеличивается при каждом коммите, изменившем объявления или курсы
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, nullable=False, default=db.func.now())
+
+event.listen(
+    CatalogVersion.__table__,
+    'after_create',
+    db.DDL("INSERT INTO catalog_version (id, version, updated_at) VALUES (1, 1, CURRENT_TIMESTAMP)"),
+)
+
 class Message(db.Model):
     __tablename__ = 'messages'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -58,6 +153,9 @@ class Message(db.Model):
 
 class Favorite(db.Model):
     __tablename__ = 'favorites'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'estate_id', name='uq_favorites_user_estate'),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     estate_id = db.Column(db.Integer, db.ForeignKey('estate.id'), nullable=False)
@@ -66,12 +164,42 @@ class Favorite(db.Model):
 
 class ViewHistory(db.Model):
     __tablename__ = 'view_history'
-    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # Таблица секционирована по месяцам (см. history_maintenance), поэтому timestamp входит в первичный ключ
+    __table_args__ = (
+        db.Index('ix_view_history_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_view_history_user_estate', 'user_id', 'estate_id'),
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
+    )
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     estate_id = db.Column(db.Integer, db.ForeignKey('estate.id'), nullable=False)
-    timestamp = db.Column(db.DateTime, default=db.func.now())
+    timestamp = db.Column(db.DateTime, primary_key=True, nullable=False, default=db.func.now())
     user = relationship("User", back_populates="view_history")
     estate = relationship("Estate")
 
+# Секция по умолчанию принимает строки, для месяца которых ещё нет своей секции
+event.listen(
+    ViewHistory.__table__,
+    'after_create',
+    db.DDL("CREATE TABLE IF NOT EXISTS view_history_default PARTITION OF view_history DEFAULT").execute_if(dialect='postgresql'),
+)
+
+Estate.photos = relationship(
+    "EstatePhoto", back_populates="estate", order_by=EstatePhoto.position,
+    cascade="all, delete-orphan", passive_deletes=True,
+)
+# Только обложка: для списков подгружается одним запросом через selectinload.
+# Позиции после удаления фото в админке не сдвигаются, поэтому обложка — наименьшая позиция, а не 0
+_other_photo = EstatePhoto.__table__.alias('other_photo')
+Estate.cover_photo = relationship(
+    "EstatePhoto",
+    primaryjoin=db.and_(
+        EstatePhoto.estate_id == Estate.id,
+        EstatePhoto.position == select(db.func.min(_other_photo.c.position))
+        .where(_other_photo.c.estate_id == EstatePhoto.estate_id)
+        .scalar_subquery(),
+    ),
+    uselist=False, viewonly=True,
+)
 User.favorites = relationship("Favorite", back_populates="user")
 User.view_history = relationship("ViewHistory", back_populates="user")
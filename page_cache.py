@@ -0,0 +1,86 @@
+import hashlib
+import threading
+from functools import wraps
+
+from flask import g, make_response, request, session
+from sqlalchemy import select
+
+from cache import TTLCache
+from catalog_events import on_catalog_change
+from models import CatalogVersion, db
+
+PAGE_CACHE_TTL = 600
+PAGE_CACHE_SIZE = 500
+# Как часто процесс перечитывает версию каталога, изменённую другими процессами
+CATALOG_VERSION_TTL = 5
+
+page_cache = TTLCache(ttl=PAGE_CACHE_TTL, maxsize=PAGE_CACHE_SIZE)
+catalog_version_cache = TTLCache(ttl=CATALOG_VERSION_TTL, maxsize=1)
+_counter_lock = threading.Lock()
+not_modified_responses = 0
+
+
+def catalog_version():
+    # (номер версии, время изменения) каталога
+    def compute():
+        row = db.session.execute(
+            select(CatalogVersion.version, CatalogVersion.updated_at).where(CatalogVersion.id == 1)
+        ).first()
+        return tuple(row) if row else (0, None)
+
+    return catalog_version_cache.get_or_compute('catalog', compute)
+
+
+@on_catalog_change
+def invalidate_pages():
+    catalog_version_cache.clear()
+    page_cache.clear()
+
+
+def is_anonymous():
+    # Страницы с flash-сообщениями тоже не кэшируются: они адресованы одному посетителю
+    return not session.get('user_logged_in') and not session.get('admin_logged_in') and '_flashes' not in session
+
+
+def _conditional(response, etag, last_modified):
+    global not_modified_responses
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    response.make_conditional(request)
+    if response.status_code == 304:
+        with _counter_lock:
+            not_modified_responses += 1
+    return response
+
+
+def cached_page(f):
+    # Готовый HTML для анонимных посетителей, ключ включает версию каталога.
+    # Представление может задать g.last_modified, иначе используется время изменения каталога
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method != 'GET' or not is_anonymous():
+            return f(*args, **kwargs)
+
+        version, catalog_updated_at = catalog_version()
+        key = (version, request.full_path)
+        entry = page_cache.get(key)
+        if entry is not None:
+            body, mimetype, etag, last_modified = entry
+            return _conditional(make_response(body, {'Content-Type': mimetype}), etag, last_modified)
+
+        response = make_response(f(*args, **kwargs))
+        if response.status_code != 200 or response.is_streamed:
+            return response
+        body = response.get_data()
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        last_modified = g.get('last_modified') or catalog_updated_at
+        page_cache.set(key, (body, response.content_type, etag, last_modified))
+        return _conditional(response, etag, last_modified)
+    return decorated_function
+
+
+def page_cache_stats():
+    return dict(page_cache.stats(), not_modified=not_modified_responses)
@@ -0,0 +1,33 @@
+import base64
+import binascii
+
+
+def encode_cursor(estate_id):
+    # Курсор - это id последней (или первой) записи страницы
+    return base64.urlsafe_b64encode(str(estate_id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    padded = token + '=' * (-len(token) % 4)
+    try:
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def page_window(current_page, total_pages, radius=2):
+    # Номера страниц вокруг текущей; None обозначает пропуск ("…")
+    if total_pages <= 1:
+        return []
+    pages = {1, total_pages}
+    pages.update(range(max(current_page - radius, 1), min(current_page + radius, total_pages) + 1))
+    window = []
+    previous = 0
+    for page_num in sorted(pages):
+        if page_num - previous > 1:
+            window.append(None)
+        window.append(page_num)
+        previous = page_num
+    return window
@@ -0,0 +1,158 @@
+import atexit
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from sqlalchemy import literal, select, union_all, update
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from models import Administrator, User, db
+
+logger = logging.getLogger(__name__)
+
+# Учётная запись из единого поиска по администраторам и пользователям
+Account = namedtuple('Account', ['kind', 'id', 'name', 'email', 'password'])
+ACCOUNT_MODELS = {'admin': Administrator, 'user': User}
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    # Хэширование и проверка паролей идут в ограниченном пуле потоков: hashlib отпускает GIL,
+    # а число одновременных KDF (и память scrypt) не растёт вместе с потоком попыток входа.
+    # Если в очереди уже PASSWORD_HASH_MAX_PENDING проверок, запрос сразу получает 503;
+    # если его проверка не завершилась за PASSWORD_HASH_WAIT_SECONDS — тоже 503
+    def __init__(self):
+        self.method = 'scrypt'
+        self.workers = 2
+        self.max_pending = 16
+        self.wait_seconds = 5
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._reference = None
+        self._lock = threading.Lock()
+        self.verified = 0
+        self.rehashed = 0
+        self.rejected = 0
+
+    def init_app(self, app):
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.max_pending = app.config['PASSWORD_HASH_MAX_PENDING']
+        self.wait_seconds = app.config['PASSWORD_HASH_WAIT_SECONDS']
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._reference = None
+        self.shutdown()
+        app.register_error_handler(PasswordHasherBusy, self.busy_response)
+        atexit.register(self.shutdown)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+            return self._executor
+
+    def record(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _run(self, func, *args):
+        # Поток запроса не ждёт свободного места в очереди
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            self.record('rejected')
+            raise PasswordHasherBusy()
+        try:
+            future = self._get_executor().submit(func, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # Место освобождается, когда задача выполнена или отменена, а не когда запрос перестал её ждать
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.wait_seconds)
+        except FutureTimeoutError:
+            future.cancel()
+            self.record('rejected')
+            raise PasswordHasherBusy() from None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored, password):
+        self.record('verified')
+        return self._run(check_password_hash, stored, password)
+
+    def reference_hash(self):
+        # Хэш с текущими параметрами: по нему проверяются несуществующие email (время ответа то же)
+        # и по его префиксу видно, что сохранённый хэш устарел. Вычисляется один раз
+        if self._reference is None:
+            self._reference = self.hash('')
+        return self._reference
+
+    def needs_rehash(self, stored):
+        # 'scrypt:32768:8:1$соль$хэш' -> 'scrypt:32768:8:1'
+        return stored.split('$', 1)[0] != self.reference_hash().split('$', 1)[0]
+
+    def busy_response(self, _error):
+        return "Сервер перегружен, повторите попытку позже", 503, {'Retry-After': '1'}
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'method': self.method,
+                'workers': self.workers,
+                'verified': self.verified,
+                'rehashed': self.rehashed,
+                'rejected': self.rejected,
+            }
+
+
+password_hasher = PasswordHasher()
+
+
+def find_accounts(email):
+    # Администратор и пользователь с этим email одним запросом; администратор проверяется первым
+    query = union_all(
+        select(literal('admin').label('kind'), Administrator.id, Administrator.full_name.label('name'),
+               Administrator.email, Administrator.password).where(Administrator.email == email),
+        select(literal('user').label('kind'), User.id, User.name, User.email, User.password).where(User.email == email),
+    ).order_by('kind')
+    return [Account(*row) for row in db.session.execute(query)]
+
+
+def rehash_password(account, password):
+    # Хэш, сохранённый со старыми параметрами, заменяется после успешного входа
+    model = ACCOUNT_MODELS[account.kind]
+    db.session.execute(
+        update(model)
+        .where(model.id == account.id, model.password == account.password)
+        .values(password=password_hasher.hash(password))
+    )
+    db.session.commit()
+    password_hasher.record('rehashed')
+    logger.info("Пароль пересчитан с параметрами %s", password_hasher.method)
+
+
+def authenticate(email, password):
+    password = password or ''
+    accounts = find_accounts(email) if email else []
+    if not accounts:
+        password_hasher.verify(password_hasher.reference_hash(), password)
+        return None
+    for account in accounts:
+        if password_hasher.verify(account.password, password):
+            if password_hasher.needs_rehash(account.password):
+                rehash_password(account, password)
+            return account
+    return None
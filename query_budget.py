@@ -0,0 +1,39 @@
+import logging
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_query(conn, *_args):
+    # Считаются только запросы, выполненные при обработке HTTP-запроса,
+    # кроме служебных (execution_options(query_budget=False)), например проверки отставания реплики
+    if has_request_context() and conn.get_execution_options().get('query_budget', True):
+        g.query_count = g.get('query_count', 0) + 1
+
+
+def query_budget(limit):
+    # Предупреждает (или падает при QUERY_BUDGET_STRICT), если представление вместе с шаблоном
+    # выполнило больше limit запросов, например из-за ленивой загрузки связей
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            started_with = g.get('query_count', 0)
+            response = f(*args, **kwargs)
+            used = g.get('query_count', 0) - started_with
+            if used > limit:
+                message = f"{request.endpoint}: выполнено {used} запросов при бюджете {limit}"
+                if current_app.config.get('QUERY_BUDGET_STRICT'):
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Delete, Insert, Select, TextClause, Update, event, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+READ_METHODS = ('GET', 'HEAD')
+# Ключ в cookie-сессии: до этого момента чтения пользователя идут в основную базу
+STICKY_SESSION_KEY = 'db_primary_until'
+
+# Отставание в секундах; если реплика проиграла всё полученное, она не отстаёт,
+# даже когда на основной базе давно не было записей. Но только пока WAL принимается потоком:
+# без WAL receiver (связь с основной базой потеряна) «проиграла всё полученное» ничего не значит,
+# и NULL отправляет чтения в основную базу
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+def is_write(clause):
+    if isinstance(clause, (Insert, Update, Delete)):
+        return True
+    if isinstance(clause, Select):
+        return clause._for_update_arg is not None
+    # Текстовые запросы могут что-то менять, на реплике они бы упали
+    return isinstance(clause, TextClause)
+
+
+class ReplicaRouter:
+    # Чтения GET-запросов идут в реплику, записи и всё остальное — в основную базу
+    def __init__(self):
+        self.enabled = False
+        self.max_lag = 0
+        self.sticky_seconds = 0
+        self.lag_check_timeout_ms = 500
+        self._lag_cache = None
+        self._lock = threading.Lock()
+        self._catalog_changed_at = 0.0
+        self._listening = False
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.writes = 0
+        self.lag_fallbacks = 0
+        self.catalog_change_fallbacks = 0
+        self.errors = 0
+
+    def init_app(self, app):
+        self.enabled = REPLICA_BIND in app.config.get('SQLALCHEMY_BINDS', {})
+        self.max_lag = app.config['DB_REPLICA_MAX_LAG_SECONDS']
+        self.sticky_seconds = app.config['DB_READ_YOUR_WRITES_SECONDS']
+        self.lag_check_timeout_ms = app.config['DB_REPLICA_LAG_CHECK_TIMEOUT_MS']
+        self._lag_cache = TTLCache(ttl=app.config['DB_REPLICA_LAG_CHECK_SECONDS'], maxsize=1)
+        if not self.enabled:
+            return
+        if not self._listening:
+            # replica импортируется из models раньше, чем catalog_events может быть загружен
+            from catalog_events import on_catalog_change
+            on_catalog_change(self.catalog_changed)
+            self._listening = True
+
+        @app.before_request
+        def reset_route():
+            # Контекст приложения может пережить запрос, поэтому выбор предыдущего запроса сбрасывается
+            g.pop('db_route', None)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def replica_lag(self, engine):
+        # Отставание проверяется не чаще раза в DB_REPLICA_LAG_CHECK_SECONDS; None — реплика недоступна.
+        # Пока проверка идёт, остальные чтения ждут её результата, поэтому она ограничена по времени:
+        # подключение — connect_timeout реплики, запрос — SET LOCAL statement_timeout
+        def compute():
+            try:
+                with engine.connect().execution_options(query_budget=False) as connection, connection.begin():
+                    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(self.lag_check_timeout_ms)}")
+                    lag = connection.execute(REPLICA_LAG_SQL).scalar()
+            except SQLAlchemyError as e:
+                self._count('errors')
+                logger.warning("Реплика недоступна, чтения идут в основную базу: %s", e)
+                return None
+            if lag is None:
+                logger.warning("Реплика не получает WAL от основной базы, чтения идут в основную базу")
+                return None
+            return float(lag)
+
+        return self._lag_cache.get_or_compute('lag', compute)
+
+    def catalog_changed(self):
+        # Кэши каталога только что сброшены: пока реплика может не видеть изменение,
+        # они заполняются из основной базы, иначе в них надолго попали бы старые данные
+        self._catalog_changed_at = time.monotonic()
+
+    def is_sticky(self):
+        return session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+    def choose_route(self, engine):
+        if request.method not in READ_METHODS or self.is_sticky():
+            return 'primary'
+        if time.monotonic() - self._catalog_changed_at < self.max_lag:
+            self._count('catalog_change_fallbacks')
+            return 'primary'
+        lag = self.replica_lag(engine)
+        if lag is None or lag > self.max_lag:
+            self._count('lag_fallbacks')
+            return 'primary'
+        return 'replica'
+
+    def engine_for(self, db_session, clause):
+        # None — основная база по обычным правилам Flask-SQLAlchemy
+        if not self.enabled or not has_request_context():
+            return None
+        if db_session._flushing or is_write(clause):
+            # После записи весь остаток запроса читает из основной базы
+            db_session.info['wrote'] = True
+            g.db_route = 'primary'
+            self._count('writes')
+            return None
+
+        route = g.get('db_route')
+        if route is None:
+            route = g.db_route = self.choose_route(db_session._db.engines[REPLICA_BIND])
+        if route == 'replica':
+            self._count('replica_reads')
+            return db_session._db.engines[REPLICA_BIND]
+        self._count('primary_reads')
+        return None
+
+    def mark_write(self):
+        # Пользователь, который только что что-то изменил, какое-то время читает из основной базы
+        if self.enabled and has_request_context():
+            session[STICKY_SESSION_KEY] = time.time() + self.sticky_seconds
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'enabled': self.enabled,
+                'replica_reads': self.replica_reads,
+                'primary_reads': self.primary_reads,
+                'writes': self.writes,
+                'lag_fallbacks': self.lag_fallbacks,
+                'catalog_change_fallbacks': self.catalog_change_fallbacks,
+                'errors': self.errors,
+            }
+        if self.enabled:
+            stats['lag_seconds'] = self._lag_cache.get('lag')
+        return stats
+
+
+replica_router = ReplicaRouter()
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            engine = replica_router.engine_for(self, clause)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def remember_write(db_session):
+    if db_session.info.pop('wrote', False):
+        replica_router.mark_write()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def forget_write(db_session):
+    db_session.info.pop('wrote', None)
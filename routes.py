@@ -1,36 +1,92 @@
-from flask import Blueprint, render_template, request, redirect, session, abort, jsonify, url_for, flash
-from models import Estate, User, Message, Administrator, ViewHistory, Favorite, db
+from flask import Blueprint, Response, current_app, g, render_template, request, redirect, session, abort, jsonify, url_for, flash, stream_with_context
+from models import Estate, User, Message, ViewHistory, Favorite, db
 from wtforms import PasswordField, EmailField, StringField, SubmitField, BooleanField
 from wtforms.validators import Email, DataRequired, EqualTo, ValidationError, Length, Regexp
 from flask_wtf import FlaskForm
 import re
+from array import array
 from functools import wraps
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy.exc import SQLAlchemyError
-from werkzeug.security import generate_password_hash
 from datetime import timedelta
 import logging
+from cache import TTLCache
+from pagination import encode_cursor, decode_cursor, page_window
+from estate_search import (
+    SORT_ORDERS, parse_price_range, range_filters_from_args, search_conditions, facet_counts,
+    search_order, highlight_snippets, load_estates_by_ids, listing_query, cover_photo_filename
+)
+from search_index import search_index
+from catalog_events import on_catalog_change
+from view_buffer import view_history_buffer
+from history_maintenance import clear_user_history
+from favorites_store import add_favorite, remove_favorite, current_favorite_ids, favorite_ids_cache
+from query_budget import query_budget
+from current_user import invalidate_user, user_cache
+from page_cache import cached_page, catalog_version, page_cache_stats
+from fragment_cache import fragment_cache
+from db_pool import engine_stats
+from replica import replica_router
+from logging_setup import logging_setup
+from passwords import authenticate, password_hasher
 
 main_bp = Blueprint('main', __name__)
 
-logging.basicConfig(
-    filename='app.log',  # Имя файла, в который будут записываться логи
-    level=logging.DEBUG,  # Уровень логирования
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'  # Формат логов
-)
+@main_bp.app_context_processor
+def inject_favorite_ids():
+    # Функция, а не значение: набор загружается только если шаблон к нему обратился
+    return {'favorite_ids': current_favorite_ids}
+
+logger = logging.getLogger(__name__)
+
+HOME_PER_PAGE = 10
+
+# Первые id каждой страницы главной: переход на любую страницу — поиск по ключу, а не OFFSET.
+# Список строится одним проходом по первичному ключу только при изменении каталога: ключ кэша —
+# версия каталога (её изменения в других процессах видны через catalog_version), срока жизни нет
+home_pages_cache = TTLCache(ttl=float('inf'), maxsize=1)
+
+def home_page_boundaries():
+    def compute():
+        numbered = select(Estate.id, func.row_number().over(order_by=Estate.id).label('position')).subquery()
+        # array вместо списка: 8 байт на страницу вместо объекта int
+        return array('q', db.session.scalars(
+            select(numbered.c.id).where((numbered.c.position - 1) % HOME_PER_PAGE == 0).order_by(numbered.c.id)
+        ))
+
+    version, _ = catalog_version()
+    return home_pages_cache.get_or_compute(version, compute)
 
 @main_bp.route("/")
+@cached_page
+@query_budget(4)
 def hello_dreamhouse():
     try:
-        estate = Estate.query.all()
-        page = request.args.get('page', 1, type=int)
-        per_page = 10
-        start = (page - 1) * per_page
-        end = start + per_page
-        total_pages = (len(estate) + per_page - 1) // per_page
+        per_page = HOME_PER_PAGE
+        boundaries = home_page_boundaries()
+        total_pages = max(len(boundaries), 1)
+        page = min(max(request.args.get('page', 1, type=int), 1), total_pages)
+        after = decode_cursor(request.args.get('after'))
+        before = decode_cursor(request.args.get('before'))
+
+        # Постраничная выборка по ключу (id): соседние страницы от курсора, остальные от первого id страницы
+        if after is not None:
+            estates_on_page = listing_query().filter(Estate.id > after).order_by(Estate.id).limit(per_page).all()
+        elif before is not None:
+            estates_on_page = listing_query().filter(Estate.id < before).order_by(Estate.id.desc()).limit(per_page).all()
+            estates_on_page.reverse()
+        elif boundaries:
+            estates_on_page = listing_query().filter(Estate.id >= boundaries[page - 1]).order_by(Estate.id).limit(per_page).all()
+        else:
+            estates_on_page = []
 
-        estates_on_page = estate[start:end]
+        prev_cursor = encode_cursor(estates_on_page[0].id) if estates_on_page and page > 1 else None
+        next_cursor = encode_cursor(estates_on_page[-1].id) if estates_on_page and page < total_pages else None
 
-        return render_template('home.html', estate=estate, estates_on_page=estates_on_page, total_pages=total_pages)
+        return render_template('home.html', estates_on_page=estates_on_page, total_pages=total_pages,
+                               current_page=page, page_window=page_window(page, total_pages),
+                               prev_cursor=prev_cursor, next_cursor=next_cursor)
     except Exception as e:
         return render_template('error.html', error=str(e)), 500
 
@@ -46,7 +102,7 @@ def register():
         new_user = User(
             name=form.name.data,
             email=form.email.data,
-            password=generate_password_hash(form.password.data)
+            password=password_hasher.hash(form.password.data)
         )
         db.session.add(new_user)
         db.session.commit()
@@ -93,46 +149,36 @@ def login():
         password = request.form.get('password')
         remember_me = request.form.get('remember_me')
 
-        logging.debug(f"Attempting login with email: {email}")
-        
-        admin = Administrator.query.filter_by(email=email).first()
-        if admin:
-            logging.debug(f"Administrator found: {admin.email}")
-        else:
-            logging.debug("No administrator found with this email")
-        
-        if admin and admin.check_password(password):
-            logging.debug("Password check passed for admin")
+        logger.debug("Attempting login with email: %s", email)
+
+        # Один запрос к обеим таблицам, проверка хэша в ограниченном пуле потоков
+        account = authenticate(email, password)
+        if account is None:
+            logger.debug("Password check failed for both admin and user")
+            return redirect("/login?failed=True")
+
+        if account.kind == 'admin':
+            logger.debug("Password check passed for admin")
             session['admin_logged_in'] = True
-            session['admin_id'] = admin.id
+            session['admin_id'] = account.id
             if remember_me:
                 session.permanent = True
                 main_bp.permanent_session_lifetime = timedelta(days=30)
             else:
                 session.permanent = False
             return redirect("/admin")
-        
-        user = User.query.filter_by(email=email).first()
-        if user:
-            logging.debug(f"User found: {user.email}")
+
+        logger.debug("Password check passed for user")
+        session['user_logged_in'] = True
+        session['user_id'] = account.id
+        session['user_name'] = account.name
+        session['user_email'] = account.email
+        if remember_me:
+            session.permanent = True
+            main_bp.permanent_session_lifetime = timedelta(days=30)
         else:
-            logging.debug("No user found with this email")
-        
-        if user and user.check_password(password):
-            logging.debug("Password check passed for user")
-            session['user_logged_in'] = True
-            session['user_id'] = user.id
-            session['user_name'] = user.name
-            session['user_email'] = user.email
-            if remember_me:
-                session.permanent = True
-                main_bp.permanent_session_lifetime = timedelta(days=30)
-            else:
-                session.permanent = False
-            return redirect('/')
-        
-        logging.debug("Password check failed for both admin and user")
-        return redirect("/login?failed=True")
+            session.permanent = False
+        return redirect('/')
     else:
         return render_template("login.html")
 
@@ -150,10 +196,12 @@ def logout():
     return redirect("/login")
 
 @main_bp.route("/contacts")
+@cached_page
 def contact_details():
     return render_template('contacts.html')
 
 @main_bp.route("/about-us")
+@cached_page
 def about_company():
     return render_template('aboutus.html')
 
@@ -161,39 +209,118 @@ def about_company():
 def place_ad():
     return render_template('place_ad.html')
 
+ESTATE_API_FIELDS = (
+    'id', 'type', 'location', 'cost', 'currency', 'cost_usd', 'bedrooms', 'area', 'floor',
+    'description', 'additional_information', 'cover_photo', 'user_id', 'admin_id'
+)
+API_STREAM_BATCH_SIZE = 500
+# Больше строк за один запрос не отдаётся (и столько же без limit), следующая порция — по курсору
+API_MAX_LIMIT = 10000
+
+def estate_api_request(args, dumps):
+    # Разбор параметров /api/estate (общий для WSGI и ASGI); ValueError с текстом ответа 400
+    fields = args.get('fields')
+    fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else list(ESTATE_API_FIELDS)
+    unknown_fields = [field for field in fields if field not in ESTATE_API_FIELDS]
+    if unknown_fields:
+        raise ValueError(f"Неизвестные поля: {', '.join(unknown_fields)}")
+    output_format = args.get('format', 'json')
+    if output_format not in ('json', 'ndjson'):
+        raise ValueError("Параметр format должен быть json или ndjson")
+    limit = args.get('limit', type=int)
+    if 'limit' in args and (limit is None or limit < 1):
+        raise ValueError("Параметр limit должен быть положительным числом")
+    limit = min(limit or API_MAX_LIMIT, API_MAX_LIMIT)
+    after = decode_cursor(args.get('after'))
+
+    try:
+        conditions = search_conditions(args.get('price_range'), args.get('bedrooms'), args.get('type'),
+                                       range_filters_from_args(args), args.get('q'))
+    except ValueError:
+        raise ValueError("Некорректный диапазон цен") from None
+
+    # id нужен всегда, чтобы выдать курсор для следующей порции
+    columns = [Estate.id] + [
+        cover_photo_filename().label(field) if field == 'cover_photo' else getattr(Estate, field)
+        for field in fields if field != 'id'
+    ]
+    query = select(*columns).where(*conditions)
+    if after is not None:
+        query = query.where(Estate.id > after)
+    query = query.order_by(Estate.id).limit(limit)
+    # Серверный курсор: строки читаются порциями, а не загружаются целиком
+    query = query.execution_options(yield_per=API_STREAM_BATCH_SIZE)
+    return EstateApiWriter(fields, output_format, limit, dumps), query
+
+class EstateApiWriter:
+    # Части потокового ответа /api/estate: начало, строки и конец с курсором следующей порции.
+    # В NDJSON курсор приходит последней строкой {"next_cursor": ...}, если порция заполнена целиком
+    def __init__(self, fields, output_format, limit, dumps):
+        self.fields = fields
+        self.output_format = output_format
+        self.limit = limit
+        self.dumps = dumps
+        self.mimetype = 'application/x-ndjson' if output_format == 'ndjson' else 'application/json'
+        self.last_id = None
+        self.count = 0
+
+    def start(self):
+        return '' if self.output_format == 'ndjson' else '{"estate": ['
+
+    def row(self, row):
+        data = row._asdict()
+        item = self.dumps({field: data[field] for field in self.fields})
+        first = not self.count
+        self.last_id = row.id
+        self.count += 1
+        if self.output_format == 'ndjson':
+            return item + '\n'
+        return ('' if first else ',') + item
+
+    def end(self):
+        next_cursor = encode_cursor(self.last_id) if self.count == self.limit else None
+        if self.output_format == 'ndjson':
+            return self.dumps({'next_cursor': next_cursor}) + '\n' if next_cursor else ''
+        return '], "next_cursor": ' + self.dumps(next_cursor) + '}'
+
 @main_bp.route("/api/estate")
 def list_estate():
     try:
-        estates = Estate.query.all()
-        return jsonify(estate=estates)
-    except Exception as e:
-        return jsonify(error=str(e)), 500
+        writer, query = estate_api_request(request.args, current_app.json.dumps)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    def generate():
+        # Запрос выполняется внутри генератора: курсор открывается в том контексте,
+        # который stream_with_context держит до конца ответа
+        yield writer.start()
+        for row in db.session.execute(query):
+            yield writer.row(row)
+        yield writer.end()
+
+    return Response(stream_with_context(generate()), mimetype=writer.mimetype)
 
 @main_bp.route("/estateitem/<int:id>")
+@cached_page
+@query_budget(3)
 def show_estate(id):
-    estate_item = Estate.query.get(id)
+    estate_item = Estate.query.options(selectinload(Estate.photos)).filter_by(id=id).first()
     if not estate_item:
         return "Not Found", 404
 
-    is_favorite = False
-    if session.get('user_logged_in'):
-        user_id = session.get('user_id')
-        if user_id:  
-            # Проверяем, есть ли недвижимость в избранном для текущего пользователя
-            favorite = Favorite.query.filter_by(user_id=user_id, estate_id=estate_item.id).first()
-            if favorite:
-                is_favorite = True
+    g.last_modified = estate_item.updated_at
+
+    # Проверяем по закэшированному набору, есть ли недвижимость в избранном текущего пользователя
+    is_favorite = estate_item.id in current_favorite_ids()
 
     
-    # Автоматическое добавление в историю просмотров
+    # Автоматическое добавление в историю просмотров (запись идёт в фоне, страница не ждёт коммита)
     if session.get('user_logged_in'):
         user_id = session.get('user_id')
         if user_id:  
-            history = ViewHistory(user_id=user_id, estate_id=id)
-            db.session.add(history)
-            db.session.commit()
+            view_history_buffer.add(user_id, id)
         else:
-            print("В сеансе отсутствует идентификатор пользователя. Не удается добавить его в журнал просмотра.")
+            logger.warning("В сеансе отсутствует идентификатор пользователя. Не удается добавить его в журнал просмотра.")
 
     return render_template('estatepage.html', estate=estate_item, is_favorite=is_favorite)
 
@@ -218,43 +345,101 @@ def add_message_to_db(data):
             )
             db.session.add(message)
             db.session.commit()
-            print("Сообщение успешно добавлено в базу данных.")
+            logger.info("Сообщение успешно добавлено в базу данных.")
         else:
-            print("Отсутствуют обязательные поля в данных.")
+            logger.warning("Отсутствуют обязательные поля в данных.")
     except SQLAlchemyError as e:
-        print("Произошла ошибка при добавлении сообщения в базу данных:", str(e))
+        logger.error("Произошла ошибка при добавлении сообщения в базу данных: %s", e)
         db.session.rollback()
         raise
 
 @main_bp.route('/search', methods=['GET'])
+@query_budget(6)
 def search():
     bedrooms = request.args.get('bedrooms')
     estate_type = request.args.get('type')
     price_range = request.args.get('price_range')
-    page = request.args.get('page', 1, type=int)
+    ranges = range_filters_from_args(request.args)
+    q = (request.args.get('q') or '').strip() or None
+    sort = request.args.get('sort') if request.args.get('sort') in SORT_ORDERS else None
+    page = max(request.args.get('page', 1, type=int), 1)
     per_page = 10
 
-    results_query = perform_search(price_range, bedrooms, estate_type)
-    total_results = results_query.count()
-    results = results_query.paginate(page=page, per_page=per_page, error_out=False).items
+    ids, total_results = search_page_ids(price_range, bedrooms, estate_type, page, per_page, ranges, sort, q)
+    results = load_estates_by_ids(ids)
+    snippets = highlight_snippets(ids, q) if request.args.get('highlight') else {}
 
     total_pages = (total_results + per_page - 1) // per_page
+    search_args = {name: value for name, value in request.args.items() if name != 'page' and value}
+
+    return render_template('search_results.html', results=results, total_pages=total_pages, current_page=page,
+                           search_args=search_args, snippets=snippets)
+
+def perform_search(price_range, bedroom, estate_type, ranges=None, q=None):
+    return db.session.query(Estate).filter(*search_conditions(price_range, bedroom, estate_type, ranges, q))
+
+SEARCH_CACHE_TTL = 60
+SEARCH_CACHE_SIZE = 1024
+
+# Кэш результатов поиска: (id на странице, общее количество) по нормализованным фильтрам
+search_cache = TTLCache(ttl=SEARCH_CACHE_TTL, maxsize=SEARCH_CACHE_SIZE)
+
+def search_page_key(price_range, bedrooms, estate_type, page, per_page, ranges=None, sort=None, q=None):
+    # Ключ кэша поиска по нормализованным фильтрам, общий для WSGI и ASGI
+    price_range, bedrooms, estate_type = (value.strip() if value else None for value in (price_range, bedrooms, estate_type))
+    return (estate_type, bedrooms, price_range, tuple(sorted((ranges or {}).items())), sort, q, page, per_page)
+
+def search_page_ids(price_range, bedrooms, estate_type, page, per_page, ranges=None, sort=None, q=None):
+    key = search_page_key(price_range, bedrooms, estate_type, page, per_page, ranges, sort, q)
+    estate_type, bedrooms, price_range = key[:3]
+    ranges = dict(key[3])
+
+    def compute():
+        offset = (page - 1) * per_page
+        # Индекс в памяти не хранит числовые колонки и текст и не сортирует по цене, такие запросы идут в SQL
+        if search_index.enabled and not ranges and not sort and not q:
+            search_index.maybe_refresh()
+            return search_index.search(price_range, bedrooms, estate_type, offset, per_page)
+        query = perform_search(price_range, bedrooms, estate_type, ranges, q)
+        if sort:
+            query = query.filter(Estate.cost_usd.isnot(None))
+        total_results = query.count()
+        ids = [row.id for row in query.with_entities(Estate.id).order_by(*search_order(sort, q)).offset(offset).limit(per_page)]
+        return ids, total_results
+
+    return search_cache.get_or_compute(key, compute)
+
+# Кэш счётчиков фасетов по состоянию фильтров
+facets_cache = TTLCache(ttl=SEARCH_CACHE_TTL, maxsize=SEARCH_CACHE_SIZE)
+
+def facets_request(args):
+    # Разбор параметров фасетов: (ключ кэша, фильтры, диапазоны, текст); ValueError при неверной цене
+    filters = tuple((args.get(name) or '').strip() or None for name in ('price_range', 'bedrooms', 'type'))
+    ranges = range_filters_from_args(args)
+    q = (args.get('q') or '').strip() or None
+    if filters[0]:
+        parse_price_range(filters[0])
+    return filters + (tuple(sorted(ranges.items())), q), filters, ranges, q
+
+@main_bp.route('/api/search/facets')
+def search_facets():
+    try:
+        key, filters, ranges, q = facets_request(request.args)
+    except ValueError:
+        return jsonify(error="Некорректный диапазон цен"), 400
 
-    return render_template('search_results.html', results=results, total_pages=total_pages, current_page=page)
-
-def perform_search(price_range, bedroom, estate_type):
-    query = db.session.query(Estate)
-    if bedroom:
-        query = query.filter_by(bedrooms=bedroom)
-    if estate_type:
-        query = query.filter_by(type=estate_type)
-    if price_range:
-        if price_range == '200000-more':
-            query = query.filter(Estate.cost >= 200000)
-        else:
-            min_price, max_price = map(int, price_range.split('-'))
-            query = query.filter(Estate.cost.between(min_price, max_price))
-    return query
+    def compute():
+        if search_index.enabled and not ranges and not q:
+            search_index.maybe_refresh()
+            return search_index.facets(*filters)
+        return facet_counts(*filters, ranges, q)
+
+    return jsonify(facets_cache.get_or_compute(key, compute))
+
+@on_catalog_change
+def invalidate_catalog_caches():
+    search_cache.clear()
+    facets_cache.clear()
 
 @main_bp.route('/user/profile')
 def profile():
@@ -281,9 +466,10 @@ def edit_profile():
         user.email = form.email.data
         
         if form.password.data:
-            user.password = generate_password_hash(form.password.data)
+            user.password = password_hasher.hash(form.password.data)
         
         db.session.commit()
+        invalidate_user(user_id)
         flash('Изменения успешно сохранены', 'success')
         return redirect('/user/profile')
     
@@ -304,14 +490,20 @@ class EditProfileForm(FlaskForm):
     submit = SubmitField('Сохранить изменения')
 
 @main_bp.route('/user/favorites')
+@query_budget(3)
 def favorites():
     if not session.get('user_logged_in'):
         return redirect('/')
     user_id = session.get('user_id')
-    user = User.query.get(user_id)
     page = request.args.get('page', 1, type=int)
     per_page = 10
-    favorites = Favorite.query.filter_by(user_id=user_id).paginate(page=page, per_page=per_page, error_out=False)
+    # Объявления загружаются тем же запросом, что и избранное, а не по одному на строку
+    favorites = (
+        Favorite.query.filter_by(user_id=user_id)
+        .options(joinedload(Favorite.estate).selectinload(Estate.cover_photo))
+        .order_by(Favorite.id.desc())
+        .paginate(page=page, per_page=per_page, error_out=False)
+    )
     return render_template('user/favorites.html', favorites=favorites)
 
 @main_bp.route('/add_to_favorites/<int:estate_id>', methods=['POST'])
@@ -320,15 +512,11 @@ def add_to_favorites(estate_id):
         return redirect('/')
     
     user_id = session.get('user_id')
-    favorite = Favorite.query.filter_by(user_id=user_id, estate_id=estate_id).first()
     
-    if favorite:
-        flash('Эта недвижимость уже в вашем списке избранного.')
-    else:
-        favorite = Favorite(user_id=user_id, estate_id=estate_id)
-        db.session.add(favorite)
-        db.session.commit()
+    if add_favorite(user_id, estate_id):
         flash('Недвижимость добавлена в ваш список избранного.')
+    else:
+        flash('Эта недвижимость уже в вашем списке избранного.')
 
     return redirect(url_for('main.show_estate', id=estate_id))
 
@@ -338,11 +526,8 @@ def remove_from_favorites(estate_id):
         return redirect('/')
     
     user_id = session.get('user_id')
-    favorite = Favorite.query.filter_by(user_id=user_id, estate_id=estate_id).first()
     
-    if favorite:
-        db.session.delete(favorite)
-        db.session.commit()
+    if remove_favorite(user_id, estate_id):
         flash('Недвижимость удалена из вашего списка избранного.')
     else:
         flash('Эта недвижимость не была в вашем списке избранного.')
@@ -350,14 +535,19 @@ def remove_from_favorites(estate_id):
     return redirect(url_for('main.show_estate', id=estate_id))
 
 @main_bp.route('/user/history')
+@query_budget(4)
 def view_history():
     if not session.get('user_logged_in'):
         return redirect('/')
     user_id = session.get('user_id')
-    user = User.query.get(user_id)
     page = request.args.get('page', 1, type=int)
     per_page = 10
-    history = ViewHistory.query.filter_by(user_id=user_id).order_by(ViewHistory.timestamp.desc()).paginate(page=page, per_page=per_page, error_out=False)
+    history = (
+        ViewHistory.query.filter_by(user_id=user_id)
+        .options(joinedload(ViewHistory.estate).selectinload(Estate.cover_photo))
+        .order_by(ViewHistory.timestamp.desc())
+        .paginate(page=page, per_page=per_page, error_out=False)
+    )
     return render_template('user/history.html', history=history)
 
 @main_bp.route('/user/clear_history', methods=['POST'])
@@ -366,11 +556,10 @@ def clear_history():
         return redirect('/')
 
     user_id = session.get('user_id')
-    user = User.query.get(user_id)
     
-    # Очистка истории просмотров пользователя
-    ViewHistory.query.filter_by(user_id=user_id).delete()
-    db.session.commit()
+    # Очистка истории просмотров пользователя, включая ещё не записанные просмотры
+    view_history_buffer.discard_user(user_id)
+    clear_user_history(user_id)
 
     flash('История просмотров очищена', 'success')
     return redirect('/user/history')
@@ -386,9 +575,28 @@ def delete_account():
     if user:
         db.session.delete(user)
         db.session.commit()
+        invalidate_user(user_id)
         session.clear()  # Удаляем сессию пользователя
         flash('Ваш аккаунт был успешно удален.', 'success')
     else:
         flash('Не удалось найти пользователя.', 'danger')
 
     return redirect('/')
+
+@main_bp.route('/api/stats')
+@admin_required
+def stats():
+    return jsonify(
+        search_cache=search_cache.stats(),
+        facets_cache=facets_cache.stats(),
+        home_pages_cache=home_pages_cache.stats(),
+        favorite_ids_cache=favorite_ids_cache.stats(),
+        user_cache=user_cache.stats(),
+        page_cache=page_cache_stats(),
+        fragment_cache=fragment_cache.stats(),
+        db_pool=engine_stats(db.engine),
+        logging=logging_setup.stats(),
+        password_hasher=password_hasher.stats(),
+        replica=replica_router.stats(),
+        view_history_buffer=view_history_buffer.stats(),
+    )
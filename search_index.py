@@ -0,0 +1,306 @@
+import bisect
+import sys
+import threading
+import time
+from array import array
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from estate_search import PRICE_RANGES, parse_price_range
+from models import Estate, db
+
+# Границы диапазонов цен из фасетов: для них битовые карты хранятся готовыми
+PRICE_BOUNDS = {price_range: parse_price_range(price_range) for price_range in PRICE_RANGES}
+
+
+def _bitmap_from_ids(ids, max_id):
+    buffer = bytearray((max_id >> 3) + 1)
+    for estate_id in ids:
+        buffer[estate_id >> 3] |= 1 << (estate_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def _in_range(cost, bounds):
+    min_price, max_price = bounds
+    return cost is not None and cost >= min_price and (max_price is None or cost <= max_price)
+
+
+def _cost_slice(costs, bounds):
+    # Часть отсортированного массива (cost_usd, id) с ценами в диапазоне, через bisect
+    min_price, max_price = bounds
+    start = bisect.bisect_left(costs, (min_price, -1))
+    if max_price is None:
+        end = len(costs)
+    else:
+        end = bisect.bisect_right(costs, (max_price, sys.maxsize))
+    return costs[start:end]
+
+
+def _page_of_bits(bitmap, offset, limit):
+    # Возвращает номера установленных битов (id объявлений) с offset по offset + limit
+    if not bitmap:
+        return []
+    words = array('Q')
+    words.frombytes(bitmap.to_bytes((bitmap.bit_length() + 63) // 64 * 8, 'little'))
+    if sys.byteorder == 'big':
+        words.byteswap()
+    ids = []
+    skipped = 0
+    for word_index, word in enumerate(words):
+        if not word:
+            continue
+        count = word.bit_count()
+        if skipped + count <= offset:
+            skipped += count
+            continue
+        base = word_index * 64
+        while word:
+            low_bit = word & -word
+            if skipped < offset:
+                skipped += 1
+            else:
+                ids.append(base + low_bit.bit_length() - 1)
+                if len(ids) == limit:
+                    return ids
+            word ^= low_bit
+    return ids
+
+
+class EstateSearchIndex:
+    # Индекс каталога в памяти процесса: битовые карты по type, bedrooms и диапазонам цен из PRICE_RANGES
+    # и отсортированный массив (cost_usd, id) для остальных диапазонов
+    def __init__(self):
+        self.enabled = False
+        self.refresh_interval = None
+        self._app = None
+        self._lock = threading.RLock()
+        # Одновременно строится только один индекс; поиск в это время работает по старому
+        self._build_lock = threading.Lock()
+        self._changes = None
+        self._refreshing = False
+        self._stale = False
+        self._built_at = 0.0
+        self._swap(self._build(()))
+
+    def _swap(self, structures):
+        (self._documents, self._all, self._by_type, self._by_bedrooms,
+         self._costs, self._by_price, self._by_bucket, self._max_id) = structures
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SEARCH_INDEX_ENABLED', False)
+        self.refresh_interval = app.config.get('SEARCH_INDEX_REFRESH_SECONDS')
+        self._app = app
+        # Индекс строится при первом поиске или в warm_up, а не при создании приложения
+
+    @staticmethod
+    def _build(rows):
+        # Новые структуры собираются без блокировки: id по значениям, битовые карты
+        # из bytearray и одна сортировка цен вместо вставки каждой строки
+        documents = {}
+        ids_by_type = {}
+        ids_by_bedrooms = {}
+        costs = []
+        for estate_id, estate_type, bedrooms, cost in rows:
+            documents[estate_id] = (estate_type, bedrooms, cost)
+            ids_by_type.setdefault(estate_type, []).append(estate_id)
+            ids_by_bedrooms.setdefault(bedrooms, []).append(estate_id)
+            if cost is not None:
+                costs.append((cost, estate_id))
+        costs.sort()
+        max_id = max(documents, default=0)
+        by_price = {}
+        by_bucket = {}
+        assigned = 0
+        for price_range, bounds in PRICE_BOUNDS.items():
+            by_price[price_range] = _bitmap_from_ids((estate_id for _, estate_id in _cost_slice(costs, bounds)), max_id)
+            # Как и CASE в SQL, для фасетов объявление попадает только в первый подходящий диапазон
+            by_bucket[price_range] = by_price[price_range] & ~assigned
+            assigned |= by_price[price_range]
+        return (
+            documents,
+            _bitmap_from_ids(documents, max_id),
+            {value: _bitmap_from_ids(ids, max_id) for value, ids in ids_by_type.items()},
+            {value: _bitmap_from_ids(ids, max_id) for value, ids in ids_by_bedrooms.items()},
+            costs,
+            by_price,
+            by_bucket,
+            max_id,
+        )
+
+    def rebuild(self):
+        with self._build_lock:
+            with self._lock:
+                self._changes = []
+            try:
+                rows = db.session.query(Estate.id, Estate.type, Estate.bedrooms, Estate.cost_usd).yield_per(5000)
+                structures = self._build(rows)
+            except BaseException:
+                with self._lock:
+                    self._changes = None
+                raise
+            with self._lock:
+                # Изменения, закоммиченные во время построения, могли не попасть в выборку
+                changes, self._changes = self._changes, None
+                self._swap(structures)
+                for estate_id, document in changes:
+                    self._remove(estate_id)
+                    if document is not None:
+                        self._add(estate_id, *document)
+                self._built_at = time.monotonic()
+
+    def maybe_refresh(self):
+        if not self._built_at:
+            with self._build_lock:
+                built = self._built_at
+            if not built:
+                self.rebuild()
+            return
+        # Изменения из других процессов не приходят через события, поэтому индекс периодически перестраивается
+        if not self.refresh_interval or self._refreshing:
+            return
+        if time.monotonic() - self._built_at < self.refresh_interval:
+            return
+        self.rebuild_in_background()
+
+    def rebuild_in_background(self):
+        # Для массовых изменений (пересчёт цен), которые не проходят через события модели.
+        # Если построение уже идёт, оно могло прочитать данные до изменения и повторяется ещё раз
+        with self._lock:
+            self._stale = True
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                with self._app.app_context():
+                    while True:
+                        with self._lock:
+                            if not self._stale:
+                                self._refreshing = False
+                                return
+                            self._stale = False
+                        self.rebuild()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def add(self, estate_id, estate_type, bedrooms, cost):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((estate_id, (estate_type, bedrooms, cost)))
+            self._remove(estate_id)
+            self._add(estate_id, estate_type, bedrooms, cost)
+
+    def remove(self, estate_id):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((estate_id, None))
+            self._remove(estate_id)
+
+    def _add(self, estate_id, estate_type, bedrooms, cost):
+        bit = 1 << estate_id
+        self._documents[estate_id] = (estate_type, bedrooms, cost)
+        self._all |= bit
+        self._by_type[estate_type] = self._by_type.get(estate_type, 0) | bit
+        self._by_bedrooms[bedrooms] = self._by_bedrooms.get(bedrooms, 0) | bit
+        if cost is not None:
+            bisect.insort(self._costs, (cost, estate_id))
+        bucket_found = False
+        for price_range, bounds in PRICE_BOUNDS.items():
+            if _in_range(cost, bounds):
+                self._by_price[price_range] |= bit
+                if not bucket_found:
+                    self._by_bucket[price_range] |= bit
+                    bucket_found = True
+        self._max_id = max(self._max_id, estate_id)
+
+    def _remove(self, estate_id):
+        document = self._documents.pop(estate_id, None)
+        if document is None:
+            return
+        estate_type, bedrooms, cost = document
+        mask = ~(1 << estate_id)
+        self._all &= mask
+        self._by_type[estate_type] &= mask
+        self._by_bedrooms[bedrooms] &= mask
+        for price_range in PRICE_BOUNDS:
+            self._by_price[price_range] &= mask
+            self._by_bucket[price_range] &= mask
+        if cost is not None:
+            position = bisect.bisect_left(self._costs, (cost, estate_id))
+            if position < len(self._costs) and self._costs[position] == (cost, estate_id):
+                del self._costs[position]
+
+    def _filter_bitmap(self, price_range, bedroom, estate_type):
+        bitmap = self._all
+        if estate_type:
+            bitmap &= self._by_type.get(estate_type, 0)
+        if bedroom:
+            bitmap &= self._by_bedrooms.get(bedroom, 0)
+        if price_range and bitmap:
+            bitmap &= self._price_bitmap(price_range)
+        return bitmap
+
+    def _price_bitmap(self, price_range):
+        bitmap = self._by_price.get(price_range)
+        if bitmap is None:
+            costs = _cost_slice(self._costs, parse_price_range(price_range))
+            bitmap = _bitmap_from_ids((estate_id for _, estate_id in costs), self._max_id)
+        return bitmap
+
+    def search(self, price_range, bedroom, estate_type, offset, limit):
+        # Возвращает id объявлений на странице (по возрастанию id) и общее количество
+        with self._lock:
+            bitmap = self._filter_bitmap(price_range, bedroom, estate_type)
+        return _page_of_bits(bitmap, offset, limit), bitmap.bit_count()
+
+    def facets(self, price_range, bedroom, estate_type):
+        # То же, что estate_search.facet_counts, но через пересечения битовых карт
+        with self._lock:
+            bitmap = self._filter_bitmap(price_range, bedroom, estate_type)
+            facets = {
+                'type': {value: (bitmap & values).bit_count() for value, values in self._by_type.items()},
+                'bedrooms': {value: (bitmap & values).bit_count() for value, values in self._by_bedrooms.items()},
+                'price_range': {value: (bitmap & values).bit_count() for value, values in self._by_bucket.items()},
+            }
+        for facet in ('type', 'bedrooms', 'price_range'):
+            facets[facet] = {value: count for value, count in facets[facet].items() if count and value is not None}
+        facets['total'] = bitmap.bit_count()
+        return facets
+
+
+search_index = EstateSearchIndex()
+
+
+# Изменения попадают в индекс только после коммита: откаченная транзакция его не трогает
+@event.listens_for(Estate, 'after_insert')
+@event.listens_for(Estate, 'after_update')
+def index_estate(_mapper, _connection, target):
+    session = object_session(target)
+    if search_index.enabled and session is not None:
+        document = (target.type, target.bedrooms, target.cost_usd)
+        session.info.setdefault('search_index_changes', {})[target.id] = document
+
+
+@event.listens_for(Estate, 'after_delete')
+def unindex_estate(_mapper, _connection, target):
+    session = object_session(target)
+    if search_index.enabled and session is not None:
+        session.info.setdefault('search_index_changes', {})[target.id] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_index_changes(session):
+    for estate_id, document in session.info.pop('search_index_changes', {}).items():
+        if document is None:
+            search_index.remove(estate_id)
+        else:
+            search_index.add(estate_id, *document)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_index_changes(session):
+    session.info.pop('search_index_changes', None)
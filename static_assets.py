@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import threading
+
+from flask import abort, send_from_directory
+from werkzeug.security import safe_join
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+HASH_LENGTH = 12
+# Загрузки меняются во время работы, поэтому адреса у них без хэша, а кэш проверяется по ETag
+MANIFEST_EXCLUDE = ('uploads/',)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hashed_name(filename, digest):
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{digest[:HASH_LENGTH]}{ext}"
+
+
+def build_manifest(static_folder):
+    # {'banner.jpg': 'banner.3f2a9c0d51e7.jpg', ...}
+    manifest = {}
+    for root, _dirs, files in os.walk(static_folder):
+        for name in files:
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            if filename.startswith(MANIFEST_EXCLUDE):
+                continue
+            manifest[filename] = hashed_name(filename, file_digest(path))
+    return manifest
+
+
+class StaticAssets:
+    # url_for('static', ...) выдаёт адреса с хэшем содержимого; такие файлы кэшируются браузером на год
+    def __init__(self):
+        self.static_folder = None
+        self.manifest_path = None
+        self.manifest = None
+        self.originals = {}
+        self._etags = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.manifest_path = app.config.get('STATIC_MANIFEST_PATH') or os.path.join(app.root_path, 'static-manifest.json')
+        app.url_defaults(self.hash_static_url)
+        app.view_functions['static'] = self.send_static_file
+
+    def load_manifest(self):
+        # Манифест собирается при деплое командой build-static-manifest,
+        # иначе один раз при первом обращении к статике (или в warm_up)
+        with self._lock:
+            if self.manifest is not None:
+                return
+            if os.path.exists(self.manifest_path):
+                with open(self.manifest_path, encoding='utf-8') as f:
+                    manifest = json.load(f)
+            else:
+                manifest = build_manifest(self.static_folder)
+            self.originals = {hashed: filename for filename, hashed in manifest.items()}
+            self.manifest = manifest
+
+    def hash_static_url(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            if self.manifest is None:
+                self.load_manifest()
+            values['filename'] = self.manifest.get(values['filename'], values['filename'])
+
+    def content_etag(self, path):
+        # Хэш содержимого пересчитывается только после изменения файла
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._etags.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        etag = file_digest(path)[:32]
+        with self._lock:
+            self._etags[path] = (key, etag)
+        return etag
+
+    def send_static_file(self, filename):
+        if self.manifest is None:
+            self.load_manifest()
+        original = self.originals.get(filename)
+        if original is not None:
+            hashed = self.manifest[original]
+            response = send_from_directory(self.static_folder, original, etag=hashed, max_age=IMMUTABLE_MAX_AGE)
+            response.cache_control.immutable = True
+            return response
+
+        path = safe_join(self.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        # Без хэша в адресе: браузер каждый раз сверяет ETag и получает 304, если файл не менялся
+        response = send_from_directory(self.static_folder, filename, etag=self.content_etag(path), max_age=0)
+        response.cache_control.no_cache = True
+        return response
+
+
+static_assets = StaticAssets()
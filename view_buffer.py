@@ -0,0 +1,190 @@
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, Integer, column, delete, select, values
+from sqlalchemy.exc import IntegrityError
+
+from models import Estate, User, ViewHistory, db
+
+logger = logging.getLogger(__name__)
+
+
+class ViewHistoryBuffer:
+    # Просмотры копятся в памяти и записываются одним многострочным INSERT:
+    # когда набралось max_events событий или прошло flush_interval секунд
+    def __init__(self):
+        self.enabled = True
+        self.max_events = 100
+        self.flush_interval = 1.0
+        self.max_queue = 10000
+        self.dedup_window = timedelta(minutes=30)
+        self._app = None
+        self._events = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.collapsed_rows = 0
+        self.dropped_rows = 0
+        self.errors = 0
+        self.last_flush_ms = None
+        self.max_flush_ms = 0.0
+
+    def init_app(self, app):
+        self._app = app
+        self.enabled = app.config.get('VIEW_HISTORY_BUFFER_ENABLED', True)
+        self.max_events = app.config.get('VIEW_HISTORY_BUFFER_SIZE', 100)
+        self.flush_interval = app.config.get('VIEW_HISTORY_FLUSH_INTERVAL_MS', 1000) / 1000
+        self.max_queue = app.config.get('VIEW_HISTORY_MAX_QUEUE', 10000)
+        self.dedup_window = timedelta(seconds=app.config.get('VIEW_HISTORY_DEDUP_SECONDS', 1800))
+        # Остаток буфера записывается при завершении процесса
+        atexit.register(self.flush)
+
+    def add(self, user_id, estate_id):
+        with self._lock:
+            # Пока база недоступна, очередь не растёт бесконечно: теряются самые старые события
+            if len(self._events) >= self.max_queue:
+                self._events.popleft()
+                self.dropped_rows += 1
+            self._events.append({'user_id': user_id, 'estate_id': estate_id, 'timestamp': datetime.now()})
+            depth = len(self._events)
+        if not self.enabled:
+            self.flush()
+            return
+        self._ensure_thread()
+        if depth >= self.max_events:
+            self._wakeup.set()
+
+    def _ensure_thread(self):
+        # Поток запускается лениво, уже после fork рабочего процесса
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='view-history-flush', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._events:
+                    return 0
+                rows = list(self._events)
+                self._events.clear()
+            started = time.perf_counter()
+            try:
+                collapsed = self._collapse(rows)
+                with self._app.app_context(), db.engine.begin() as connection:
+                    replaced = connection.execute(self._delete_statement(collapsed)).rowcount if self.dedup_window else 0
+                    # Заменённые просмотры не считаются новыми записями
+                    inserted = connection.execute(self._insert_statement(collapsed)).rowcount - replaced
+            except IntegrityError:
+                # Пользователя или объявление удалили между проверкой и вставкой: повтор не поможет
+                self.errors += 1
+                self.dropped_rows += len(rows)
+                logger.exception("История просмотров не записана, порция отброшена (%d событий)", len(rows))
+                return 0
+            except Exception:
+                self.errors += 1
+                logger.exception("Не удалось записать историю просмотров (%d событий)", len(rows))
+                self._requeue(rows)
+                return 0
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.flushed_rows += inserted
+            self.collapsed_rows += len(rows) - inserted
+            self.last_flush_ms = round(elapsed_ms, 2)
+            self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+            return inserted
+
+    def _collapse(self, rows):
+        # Повторные просмотры одного объявления в пределах окна схлопываются в одну запись.
+        # Из серии остаётся последний просмотр (как и в миграции d15a8e3b6f07), поэтому
+        # повторно открытое объявление поднимается наверх истории
+        if not self.dedup_window:
+            return rows
+        last_index = {}
+        collapsed = []
+        for row in rows:
+            key = (row['user_id'], row['estate_id'])
+            index = last_index.get(key)
+            if index is not None and row['timestamp'] - collapsed[index]['timestamp'] < self.dedup_window:
+                collapsed[index] = None
+            last_index[key] = len(collapsed)
+            collapsed.append(row)
+        return [row for row in collapsed if row is not None]
+
+    @staticmethod
+    def _new_views(rows):
+        return values(
+            column('user_id', Integer), column('estate_id', Integer), column('timestamp', DateTime), name='new_views'
+        ).data([(row['user_id'], row['estate_id'], row['timestamp']) for row in rows])
+
+    def _delete_statement(self, rows):
+        # Уже записанный просмотр в пределах окна перед новым удаляется: новый займёт его место.
+        # Нижняя граница по timestamp-константе оставляет в плане только последние секции
+        table = ViewHistory.__table__
+        new_views = self._new_views(rows)
+        return delete(table).where(
+            table.c.timestamp > min(row['timestamp'] for row in rows) - self.dedup_window,
+            select(new_views.c.user_id).where(
+                new_views.c.user_id == table.c.user_id,
+                new_views.c.estate_id == table.c.estate_id,
+                table.c.timestamp <= new_views.c.timestamp,
+                table.c.timestamp > new_views.c.timestamp - self.dedup_window,
+            ).exists(),
+        )
+
+    def _insert_statement(self, rows):
+        # INSERT ... SELECT из VALUES. Просмотры удалённых за это время пользователей и объявлений
+        # пропускаются: иначе нарушение внешнего ключа возвращало бы всю порцию в очередь снова и снова
+        table = ViewHistory.__table__
+        new_views = self._new_views(rows)
+        conditions = [
+            select(User.id).where(User.id == new_views.c.user_id).exists(),
+            select(Estate.id).where(Estate.id == new_views.c.estate_id).exists(),
+        ]
+        return table.insert().from_select(
+            ['user_id', 'estate_id', 'timestamp'],
+            select(new_views.c.user_id, new_views.c.estate_id, new_views.c.timestamp).where(*conditions),
+        )
+
+    def discard_user(self, user_id):
+        # Ещё не записанные просмотры пользователя, очистившего историю
+        with self._lock:
+            self._events = deque(event for event in self._events if event['user_id'] != user_id)
+
+    def _requeue(self, rows):
+        # Неудачная порция возвращается в начало очереди; при переполнении теряются самые старые события
+        with self._lock:
+            self._events.extendleft(reversed(rows))
+            while len(self._events) > self.max_queue:
+                self._events.popleft()
+                self.dropped_rows += 1
+
+    def stats(self):
+        return {
+            'queue_depth': len(self._events),
+            'flushes': self.flushes,
+            'flushed_rows': self.flushed_rows,
+            'collapsed_rows': self.collapsed_rows,
+            'dropped_rows': self.dropped_rows,
+            'errors': self.errors,
+            'last_flush_ms': self.last_flush_ms,
+            'max_flush_ms': self.max_flush_ms,
+        }
+
+
+view_history_buffer = ViewHistoryBuffer()
@@ -0,0 +1,41 @@
+import logging
+import time
+
+from sqlalchemy import text
+
+from history_maintenance import ensure_partitions
+from models import db
+from search_index import search_index
+from static_assets import static_assets
+
+logger = logging.getLogger(__name__)
+
+
+def init_database():
+    # Таблицы для разработки и тестов; в рабочей базе схему ведут миграции
+    db.create_all()
+    with db.engine.begin() as connection:
+        ensure_partitions(connection)
+
+
+def warm_up(app):
+    # Всё, что иначе выполнилось бы при первом запросе: соединение с БД, индекс поиска,
+    # манифест статики и компиляция шаблонов. Возвращает длительность шагов в секундах
+    timings = {}
+
+    def step(name, func):
+        started = time.perf_counter()
+        func()
+        timings[name] = time.perf_counter() - started
+
+    with app.app_context():
+        step('database', lambda: db.session.execute(text("SELECT 1")))
+        if search_index.enabled:
+            step('search_index', search_index.rebuild)
+        step('static_manifest', static_assets.load_manifest)
+        step('templates', lambda: [
+            app.jinja_env.get_template(name)
+            for name in app.jinja_env.list_templates(extensions=['html'])
+        ])
+    logger.info("Прогрев завершён: %s", ', '.join(f"{name} {seconds:.3f} с" for name, seconds in timings.items()))
+    return timings